@@ -88,9 +88,9 @@ def uml_from_prompt():
         raw_focus = data.get('focus')
         focus = None
         if isinstance(raw_focus, (list, tuple)):
-            focus = [str(item) for item in raw_focus if str(item).strip()]
-        elif isinstance(raw_focus, str) and raw_focus.strip():
-            focus = [segment.strip() for segment in raw_focus.split(',') if segment.strip()]
+            focus = [item for item in map(str.strip, map(str, raw_focus)) if item] or None
+        elif isinstance(raw_focus, str):
+            focus = [segment for segment in map(str.strip, raw_focus.split(',')) if segment] or None
 
         if isinstance(diagram_type, str):
             diagram_type_normalized = diagram_type.lower()
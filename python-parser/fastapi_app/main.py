@@ -34,10 +34,9 @@ from utils.error_handler import (
             )
         except Exception as ai_exc:
             # Fallback: return stub diagram, log error, do not crash
-            from plantuml.llm import _stub_diagram, _normalize_diagram
+            from plantuml.llm import _normalized_stub
             logging.error(f'{{"event": "ai_fallback", "error": "{ai_exc}"}}')
-            stub = _stub_diagram(diagram_type_normalized, output_format=output_format)
-            llm_result = _normalize_diagram(stub, diagram_type_normalized, output_format)
+            llm_result = _normalized_stub(diagram_type_normalized, output_format)
             llm_result['source'] = 'fallback'
             llm_result['warnings'] = [f'AI enrichment failed: {ai_exc}']
         llm_duration = time.time() - llm_start
@@ -85,9 +84,9 @@ async def uml_from_prompt(request: Request):
     raw_focus = data.get('focus')
     focus = None
     if isinstance(raw_focus, (list, tuple)):
-        focus = [str(item) for item in raw_focus if str(item).strip()]
-    elif isinstance(raw_focus, str) and raw_focus.strip():
-        focus = [segment.strip() for segment in raw_focus.split(',') if segment.strip()]
+        focus = [item for item in map(str.strip, map(str, raw_focus)) if item] or None
+    elif isinstance(raw_focus, str):
+        focus = [segment for segment in map(str.strip, raw_focus.split(',')) if segment] or None
     if isinstance(diagram_type, str):
         diagram_type_normalized = diagram_type.lower()
         if diagram_type_normalized not in SUPPORTED_DIAGRAM_TYPES:
@@ -3,11 +3,39 @@ PlantUML Class Diagram Builder
 Converts code analysis schema to PlantUML class diagram syntax
 """
 
+import io
 import logging
-from typing import Dict, Any, List, Set, Optional
+import sys
+from typing import IO, Dict, Any, Callable, List, Set, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Stereotype -> PlantUML keyword / annotation ('abstract' also covers abstract=True)
+_KEYWORD_BY_STEREOTYPE = {
+    'interface': 'interface',
+    'abstract': 'abstract class',
+    'enum': 'enum',
+    'struct': 'class',
+}
+
+_ANNOTATION_BY_STEREOTYPE = {
+    'interface': ' <<interface>>',
+    'abstract': ' <<abstract>>',
+    'enum': ' <<enumeration>>',
+    'struct': ' <<struct>>',
+}
+
+# Characters replaced with '_' by _sanitize_class_name
+_SANITIZE_TABLE = str.maketrans({ch: '_' for ch in '<>[]() '})
+
+# Characters buffered by build_to before they are flushed to the target stream
+_FLUSH_THRESHOLD = 64 * 1024
+
+
+def _intern(value: Any) -> Any:
+    """Intern plain strings so repeated set/dict lookups can match by identity."""
+    return sys.intern(value) if type(value) is str else value
+
 
 class ClassDiagramBuilder:
     """
@@ -34,6 +62,9 @@ class ClassDiagramBuilder:
         'package': '~'
     }
     
+    # Schema keys rendered when no language filter is given
+    DEFAULT_LANGUAGES = ('python', 'java', 'csharp', 'javascript', 'typescript', 'cpp', 'c')
+    
     def __init__(self, config: Optional[Dict[str, Any]] = None):
         """
         Initialize class diagram builder.
@@ -46,6 +77,9 @@ class ClassDiagramBuilder:
         self.show_methods = self.config.get('show_methods', True)
         self.show_fields = self.config.get('show_fields', True)
         self.show_private = self.config.get('show_private', True)
+        # Header/footer depend only on the theme, so render them once per builder
+        self._header_str = "\n".join(self._build_header()) + "\n"
+        self._footer_str = "\n".join(self._build_footer())
     
     def build(
         self, 
@@ -62,43 +96,81 @@ class ClassDiagramBuilder:
         Returns:
             PlantUML syntax string
         """
+        buf = io.StringIO()
+        self.build_to(schema, buf, language_filter)
+        return buf.getvalue()
+
+    def build_to(
+        self,
+        schema: Dict[str, Any],
+        fp: IO[str],
+        language_filter: Optional[List[str]] = None
+    ) -> None:
+        """
+        Build complete PlantUML class diagram, writing it to a text stream.
+        
+        Output destined for files or sockets is coalesced in memory and
+        flushed to ``fp`` in chunks of roughly ``_FLUSH_THRESHOLD`` characters,
+        so the full diagram is never materialized as one string.
+        
+        Args:
+            schema: Analysis schema
+            fp: Writable text stream (file object, StringIO, ...)
+            language_filter: Optional list of languages to include
+        """
         logger.info("Building PlantUML class diagram")
         
-        lines = self._build_header()
+        if isinstance(fp, io.StringIO):
+            # Already an in-memory buffer; coalescing would only add a copy
+            write = fp.write
+            flush = None
+        else:
+            pending = io.StringIO()
+
+            def flush() -> None:
+                fp.write(pending.getvalue())
+                pending.seek(0)
+                pending.truncate()
+
+            def write(chunk: str) -> None:
+                pending.write(chunk)
+                if pending.tell() >= _FLUSH_THRESHOLD:
+                    flush()
         
-        # Track all class names for relationship validation
-        all_classes = set()
+        write(self._header_str)
         
         # Build classes by language
-        languages = language_filter if language_filter else [
-            'python', 'java', 'csharp', 'javascript', 'typescript', 'cpp', 'c'
-        ]
+        languages = language_filter if language_filter else self.DEFAULT_LANGUAGES
+        
+        # All class names for relationship validation, collected in one pass
+        all_classes = frozenset(
+            _intern(cls.get('class'))
+            for lang in languages
+            for cls in schema.get(lang) or ()
+            if cls.get('class')
+        )
         
         for lang in languages:
             classes = schema.get(lang, [])
             if classes:
-                lines.append(f"' {lang.upper()} Classes")
+                write(f"' {lang.upper()} Classes\n")
                 for cls in classes:
-                    class_lines = self._build_class(cls, lang)
-                    lines.extend(class_lines)
-                    all_classes.add(cls.get('class'))
-                lines.append("")
+                    self._build_class(cls, lang, write)
+                write("\n")
         
         # Build relationships
         relations = schema.get('relations', [])
         if relations:
-            lines.append("' Relationships")
-            relationship_lines = self._build_relationships(relations, all_classes)
-            lines.extend(relationship_lines)
-            lines.append("")
+            write("' Relationships\n")
+            self._build_relationships(relations, all_classes, write)
+            write("\n")
         
         # Add footer
-        lines.extend(self._build_footer())
+        write(self._footer_str)
+        if flush is not None:
+            flush()
         
-        result = "\n".join(lines)
         logger.info(f"Generated PlantUML with {len(all_classes)} classes and {len(relations)} relationships")
-        
-        return result
 
     # ------------------------------------------------------------------
     # Backwards-compatible helpers used by unit tests and external callers
@@ -106,8 +178,10 @@ class ClassDiagramBuilder:
 
     def build_class(self, cls: Dict[str, Any], language: str = 'python') -> str:
         """Public helper that returns a single class definition as PlantUML."""
-        lines = self._build_class(cls, language)
-        return "\n".join(lines)
+        buf = io.StringIO()
+        self._build_class(cls, language, buf.write)
+        # Drop the newline terminating the last (blank) line
+        return buf.getvalue()[:-1]
 
     def build_relationship(
         self,
@@ -117,8 +191,9 @@ class ClassDiagramBuilder:
         """Public helper that returns a single relationship definition."""
         if all_classes is None:
             all_classes = {relation.get('from'), relation.get('to')}
-        lines = self._build_relationships([relation], all_classes)
-        return lines[0] if lines else ""
+        buf = io.StringIO()
+        self._build_relationships([relation], all_classes, buf.write)
+        return buf.getvalue()[:-1]
     
     def _build_header(self) -> List[str]:
         """Build diagram header with configuration."""
@@ -145,79 +220,75 @@ class ClassDiagramBuilder:
         """Build diagram footer."""
         return ["@enduml"]
     
-    def _build_class(self, cls: Dict[str, Any], language: str) -> List[str]:
+    def _build_class(self, cls: Dict[str, Any], language: str, write: Callable[[str], Any]) -> None:
         """
         Build single class definition.
         
         Args:
             cls: Class dictionary from schema
             language: Programming language
-        
-        Returns:
-            List of PlantUML lines
+            write: Output sink (e.g. ``StringIO.write``); each line is newline-terminated
         """
-        lines = []
-        
         class_name = cls.get('class', 'UnnamedClass')
         # Support both 'stereotype' (from analyze.py) and 'type' (for test compatibility)
         stereotype = cls.get('stereotype') or cls.get('type', 'class')
         is_abstract = cls.get('abstract', False)
         package = cls.get('package') or cls.get('namespace')
+        # Read once; the separator below depends on methods even when they are hidden
+        methods = cls.get('methods')
         
-        # Build class declaration with stereotype
-        class_keyword = self._get_class_keyword(stereotype, is_abstract)
-        
-        # Add stereotype annotation if needed
-        stereotype_annotation = ""
-        if stereotype == 'interface':
-            stereotype_annotation = " <<interface>>"
-        elif stereotype == 'abstract' or is_abstract:
-            stereotype_annotation = " <<abstract>>"
-        elif stereotype == 'enum':
-            stereotype_annotation = " <<enumeration>>"
-        elif stereotype == 'struct':
-            stereotype_annotation = " <<struct>>"
+        # Build class declaration with stereotype (interfaces stay interfaces even if abstract)
+        effective = 'abstract' if is_abstract and stereotype != 'interface' else stereotype
+        class_keyword = _KEYWORD_BY_STEREOTYPE.get(effective, 'class')
+        stereotype_annotation = _ANNOTATION_BY_STEREOTYPE.get(effective, '')
         
-        lines.append(f"{class_keyword} {class_name}{stereotype_annotation} {{")
+        write(f"{class_keyword} {class_name}{stereotype_annotation} {{\n")
         
         # Add fields
         if self.show_fields:
             fields = cls.get('fields', [])
             if fields:
+                # Schemas use one member representation throughout; pick the formatter once
+                format_field = self._format_field_dict if isinstance(fields[0], dict) else self._format_field_str
                 for field in fields:
-                    field_line = self._format_field(field)
+                    try:
+                        field_line = format_field(field)
+                    except AttributeError:
+                        # Mixed dict/string list: dispatch this member on its own type
+                        field_line = self._format_field(field)
                     if field_line:
-                        lines.append(f"  {field_line}")
+                        write(f"  {field_line}\n")
                 
                 # Separator between fields and methods
-                if cls.get('methods'):
-                    lines.append("  ..")
+                if methods:
+                    write("  ..\n")
         
         # Add methods
         if self.show_methods:
-            methods = cls.get('methods', [])
             if methods:
+                format_method = self._format_method_dict if isinstance(methods[0], dict) else self._format_method_str
                 for method in methods:
-                    method_line = self._format_method(method)
+                    try:
+                        method_line = format_method(method)
+                    except AttributeError:
+                        method_line = self._format_method(method)
                     if method_line:
-                        lines.append(f"  {method_line}")
+                        write(f"  {method_line}\n")
 
         # Add enum values if present
         if stereotype == 'enum':
             for value in cls.get('values', []) or []:
-                lines.append(f"  {value}")
+                write(f"  {value}\n")
         
-        lines.append("}")
+        write("}\n")
         
         # Add package/namespace annotation
         if package:
-            lines.append(f"note right of {class_name}")
-            lines.append(f"  Package: {package}")
-            lines.append("end note")
+            write(f"note right of {class_name}\n")
+            write(f"  Package: {package}\n")
+            write("end note\n")
         
-        lines.append("")
-        
-        return lines
+        write("\n")
     
     def _get_class_keyword(self, stereotype: str, is_abstract: bool) -> str:
         """
@@ -230,14 +301,9 @@ class ClassDiagramBuilder:
         Returns:
             PlantUML keyword
         """
-        if stereotype == 'interface':
-            return 'interface'
-        elif stereotype == 'abstract' or is_abstract:
-            return 'abstract class'
-        elif stereotype == 'enum':
-            return 'enum'
-        else:
-            return 'class'
+        if is_abstract and stereotype != 'interface':
+            stereotype = 'abstract'
+        return _KEYWORD_BY_STEREOTYPE.get(stereotype, 'class')
     
     def _format_field(self, field) -> Optional[str]:
         """
@@ -250,46 +316,44 @@ class ClassDiagramBuilder:
         Returns:
             Formatted field line or None if should be hidden
         """
-        # Handle dictionary input (from schema)
         if isinstance(field, dict):
-            name = field.get('name', '')
-            field_type = field.get('type', '')
-            visibility = field.get('visibility', 'public')
-            
-            # Map visibility to symbol
-            visibility_map = {
-                'public': '+',
-                'private': '-',
-                'protected': '#',
-                'package': '~'
-            }
-            vis_symbol = visibility_map.get(visibility, '+')
-            
-            # Filter private fields if configured
-            if not self.show_private and vis_symbol == '-':
-                return None
-            
-            # Format: + name: type
-            if field_type:
-                return f"{vis_symbol} {name}: {field_type}"
-            else:
-                return f"{vis_symbol} {name}"
+            return self._format_field_dict(field)
+        return self._format_field_str(field)
+    
+    def _format_field_dict(self, field: Dict[str, Any]) -> Optional[str]:
+        """Format a field given as a schema dict."""
+        visibility = field.get('visibility', 'public')
+        
+        # Filter private fields if configured, before doing any formatting work
+        if not self.show_private and visibility == 'private':
+            return None
+        
+        name = field.get('name', '')
+        field_type = field.get('type', '')
+        
+        # Map visibility to symbol
+        vis_symbol = self.VISIBILITY.get(visibility, '+')
         
-        # Handle string input (legacy format)
+        # Format: + name: type
+        if field_type:
+            return f"{vis_symbol} {name}: {field_type}"
+        else:
+            return f"{vis_symbol} {name}"
+    
+    def _format_field_str(self, field: str) -> Optional[str]:
+        """Format a field given as a legacy string."""
         field = field.strip()
         if not field:
             return None
         
+        # Filter private fields if configured
+        visibility = field[0]
+        if visibility == '-' and not self.show_private:
+            return None
+        
         # Check if field already has visibility
-        if field[0] in ['+', '-', '#', '~']:
-            visibility = field[0]
-            field_rest = field[1:].strip()
-            
-            # Filter private fields if configured
-            if not self.show_private and visibility == '-':
-                return None
-            
-            return f"{visibility} {field_rest}"
+        if visibility in ['+', '-', '#', '~']:
+            return f"{visibility} {field[1:].strip()}"
         
         # No visibility specified, default to public
         return f"+ {field}"
@@ -305,52 +369,49 @@ class ClassDiagramBuilder:
         Returns:
             Formatted method line or None if should be hidden
         """
-        # Handle dictionary input (from schema)
         if isinstance(method, dict):
-            name = method.get('name', '')
-            visibility = method.get('visibility', 'public')
-            return_type = method.get('return_type', '')
-            params = method.get('params', [])
-            
-            # Map visibility to symbol
-            visibility_map = {
-                'public': '+',
-                'private': '-',
-                'protected': '#',
-                'package': '~'
-            }
-            vis_symbol = visibility_map.get(visibility, '+')
-            
-            # Filter private methods if configured
-            if not self.show_private and vis_symbol == '-':
-                return None
-            
-            # Format parameters (filter out 'self' for Python)
-            param_list = [p for p in params if p != 'self']
-            param_str = ', '.join(param_list) if param_list else ''
-            
-            # Format: + methodName(params): returnType
-            method_signature = f"{name}({param_str})"
-            if return_type:
-                method_signature += f": {return_type}"
-            
-            return f"{vis_symbol} {method_signature}"
+            return self._format_method_dict(method)
+        return self._format_method_str(method)
+    
+    def _format_method_dict(self, method: Dict[str, Any]) -> Optional[str]:
+        """Format a method given as a schema dict."""
+        visibility = method.get('visibility', 'public')
+        
+        # Filter private methods if configured, before doing any formatting work
+        if not self.show_private and visibility == 'private':
+            return None
+        
+        name = method.get('name', '')
+        return_type = method.get('return_type', '')
+        params = method.get('params', [])
         
-        # Handle string input (legacy format)
+        # Map visibility to symbol
+        vis_symbol = self.VISIBILITY.get(visibility, '+')
+        
+        # Format parameters (filter out 'self' for Python)
+        param_str = ', '.join(p for p in params if p != 'self')
+        
+        # Format: + methodName(params): returnType
+        method_signature = f"{name}({param_str})"
+        if return_type:
+            method_signature += f": {return_type}"
+        
+        return f"{vis_symbol} {method_signature}"
+    
+    def _format_method_str(self, method: str) -> Optional[str]:
+        """Format a method given as a legacy string."""
         method = method.strip()
         if not method:
             return None
         
+        # Filter private methods if configured
+        visibility = method[0]
+        if visibility == '-' and not self.show_private:
+            return None
+        
         # Check if method already has visibility
-        if method[0] in ['+', '-', '#', '~']:
-            visibility = method[0]
-            method_rest = method[1:].strip()
-            
-            # Filter private methods if configured
-            if not self.show_private and visibility == '-':
-                return None
-            
-            return f"{visibility} {method_rest}"
+        if visibility in ['+', '-', '#', '~']:
+            return f"{visibility} {method[1:].strip()}"
         
         # No visibility specified, default to public for methods
         return f"+ {method}"
@@ -358,25 +419,24 @@ class ClassDiagramBuilder:
     def _build_relationships(
         self, 
         relations: List[Dict[str, Any]],
-        all_classes: Set[str]
-    ) -> List[str]:
+        all_classes: Set[str],
+        write: Callable[[str], Any]
+    ) -> None:
         """
         Build relationship definitions.
         
         Args:
             relations: List of relationship dictionaries
             all_classes: Set of all class names for validation
-        
-        Returns:
-            List of PlantUML relationship lines
+            write: Output sink; each relationship line is newline-terminated
         """
-        lines = []
-        seen_relations = set()
-        
+        # Validate endpoints and drop duplicates in one pass; the first occurrence of a
+        # (from, to, type) key wins and keeps its position
+        unique_relations: Dict[Tuple[Any, Any, Any], Dict[str, Any]] = {}
+        remember = unique_relations.setdefault
         for relation in relations:
-            from_class = relation.get('from')
-            to_class = relation.get('to')
-            rel_type = relation.get('type', 'association')
+            from_class = _intern(relation.get('from'))
+            to_class = _intern(relation.get('to'))
             
             # Validate classes exist
             if not from_class or not to_class:
@@ -386,14 +446,16 @@ class ClassDiagramBuilder:
                 logger.debug(f"Skipping relation {from_class} -> {to_class}: class not found")
                 continue
             
-            # Avoid duplicate relationships
-            rel_key = (from_class, to_class, rel_type)
-            if rel_key in seen_relations:
-                continue
-            seen_relations.add(rel_key)
-            
+            remember((from_class, to_class, _intern(relation.get('type', 'association'))), relation)
+        
+        # Collect the block locally and hand it to the sink in one write
+        rel_lines: List[str] = []
+        add_line = rel_lines.append
+        arrow_get = self.RELATIONSHIP_ARROWS.get
+        
+        for (from_class, to_class, rel_type), relation in unique_relations.items():
             # Get appropriate arrow
-            arrow = self.RELATIONSHIP_ARROWS.get(rel_type, '--')
+            arrow = arrow_get(rel_type, '--')
             
             # Add multiplicity if available (support both formats)
             multiplicity = relation.get('multiplicity', {})
@@ -404,27 +466,17 @@ class ClassDiagramBuilder:
                 multiplicity_from = relation.get('multiplicity_from', '')
                 multiplicity_to = relation.get('multiplicity_to', '')
             
-            # Build relationship line
-            rel_line = f"{from_class} "
-            
-            if multiplicity_from:
-                rel_line += f'"{multiplicity_from}" '
-            
-            rel_line += arrow
-            
-            if multiplicity_to:
-                rel_line += f' "{multiplicity_to}"'
-            
-            rel_line += f" {to_class}"
-            
-            # Add label if available
+            # Optional fragments: multiplicities around the arrow, label at the end
+            mult_from = f'"{multiplicity_from}" ' if multiplicity_from else ''
+            mult_to = f' "{multiplicity_to}"' if multiplicity_to else ''
             label = relation.get('label', '')
-            if label:
-                rel_line += f" : {label}"
+            label_suffix = f" : {label}" if label else ''
             
-            lines.append(rel_line)
+            add_line(f"{from_class} {mult_from}{arrow}{mult_to} {to_class}{label_suffix}")
         
-        return lines
+        if rel_lines:
+            rel_lines.append("")
+            write("\n".join(rel_lines))
     
     def _sanitize_class_name(self, name: str) -> str:
         """
@@ -436,12 +488,8 @@ class ClassDiagramBuilder:
         Returns:
             Sanitized name
         """
-        # Remove special characters that might break PlantUML
-        name = name.replace('<', '_').replace('>', '_')
-        name = name.replace('[', '_').replace(']', '_')
-        name = name.replace('(', '_').replace(')', '_')
-        name = name.replace(' ', '_')
-        return name
+        # Replace special characters that might break PlantUML in one pass
+        return name.translate(_SANITIZE_TABLE)
     
     def _get_field_visibility(self, field: str) -> str:
         """
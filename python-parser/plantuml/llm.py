@@ -4,30 +4,105 @@ from __future__ import annotations
 
 import logging
 import os
-from typing import Any, Dict, Optional
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from prompts.plantuml_prompt import SUPPORTED_FORMATS, build_plantuml_prompt
 
+import gzip
 import hashlib
 import pathlib
 import json
 from utils.groq_client import GroqClient, GroqClientDisabledError, GroqClientError
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - stdlib json fallback when orjson is unavailable
+    orjson = None
+
 logger = logging.getLogger(__name__)
+_RAW_OUTPUT_LOGGER = logging.getLogger("plantuml.llm.raw_output")
+
+_RE_CLASS_DECL = re.compile(r'class ([^\s{]+)')
+# Keywords from other diagram kinds that must not leak into state/activity output.
+# Leading \b so identifiers such as "subclass " or "my_node " are not caught.
+_FORBIDDEN_KEYWORDS = r'\b(?:class|node|component|package|artifact|database|cloud) '
+_RE_STATE_FORBIDDEN = re.compile(_FORBIDDEN_KEYWORDS)
+# Matched against the lowercased line
+_RE_ACTIVITY_FORBIDDEN = re.compile(r':@startuml;|:@enduml;|' + _FORBIDDEN_KEYWORDS)
+_UML_BOUNDARY = re.compile(r'@(?:(start)|end)uml', re.IGNORECASE)
+_RE_BATCH_SENTINEL = re.compile(r'^[ \t]*=+[ \t]*DIAGRAM[ \t]+(\d+)[ \t]*=+[ \t]*$', re.MULTILINE | re.IGNORECASE)
+
+# Completion budget of a single-diagram Groq request
+_SINGLE_MAX_TOKENS = 4096
+
+# Batched generation: completion budget per diagram (same as a single call) and per Groq
+# request (the model's output cap), prompts per request, and single-shot fallback fan-out
+_BATCH_TOKENS_PER_DIAGRAM = _SINGLE_MAX_TOKENS
+_BATCH_MAX_TOKENS = 8192
+_BATCH_CHUNK = _BATCH_MAX_TOKENS // _BATCH_TOKENS_PER_DIAGRAM
+_BATCH_MAX_WORKERS = 8
 
 STUB_LLM = os.getenv('STUB_LLM', 'false').lower() in ('1', 'true', 'yes')
 
 DEFAULT_MODEL = os.getenv('GROQ_PLANTUML_MODEL') or os.getenv('GROQ_MODEL', 'meta-llama/llama-4-scout-17b-16e-instruct')
 GROQ_CLIENT = GroqClient()
 
+
+def _load_config() -> SimpleNamespace:
+    # GroqClient fixes enabled/api_key at construction, so they can be snapshotted once
+    return SimpleNamespace(
+        stub=os.getenv('STUB_LLM', 'false').lower() in ('1', 'true', 'yes'),
+        client_ready=bool(GROQ_CLIENT.enabled and GROQ_CLIENT.api_key),
+    )
+
+
+_CFG = _load_config()
+
+
+def reload_config() -> None:
+    """Re-read STUB_LLM and the Groq client's enabled/API-key state (e.g. after a test patches them)."""
+    global _CFG
+    _CFG = _load_config()
+    _parse_stub_flag.cache_clear()
+
+
 # Local cache directory for AI results
 LOCAL_CACHE_DIR = pathlib.Path(__file__).parent.parent / 'cache'
 LOCAL_CACHE_DIR.mkdir(exist_ok=True)
 
-def _local_cache_key(prompt: str, diagram_type: str, output_format: str, context: Optional[dict], schema: Optional[dict], style_preferences: Optional[dict], focus: Optional[list]) -> str:
-    """Generate a unique hash key for the AI enrichment cache."""
+def _canonical_json(data: Any) -> bytes:
+    """Serialize ``data`` to compact, key-sorted UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+def _load_json(raw: bytes) -> Any:
+    """Parse UTF-8 JSON bytes, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace runs only; case and punctuation reach the model and shape the
+    identifiers it emits, so they stay part of the cache key."""
+    return ' '.join(prompt.split())
+
+# 192-bit keys: ample collision resistance for a local cache, 48-char file names
+_CACHE_KEY_DIGEST_SIZE = 24
+
+def _local_cache_key(prompt: Union[str, List[str]], diagram_type: str, output_format: str, context: Optional[dict], schema: Optional[dict], style_preferences: Optional[dict], focus: Optional[list]) -> str:
+    """Generate a unique hash key for the AI enrichment cache.
+
+    ``prompt`` may be a list of batch descriptions; they are fed to the hasher one by one
+    instead of being joined into a single string first.
+    """
     key_data = {
-        'prompt': prompt,
         'diagram_type': diagram_type,
         'output_format': output_format,
         'context': context,
@@ -35,26 +110,77 @@ def _local_cache_key(prompt: str, diagram_type: str, output_format: str, context
         'style_preferences': style_preferences,
         'focus': focus,
     }
-    raw = json.dumps(key_data, sort_keys=True, separators=(",", ":"))
-    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    if isinstance(prompt, list):
+        hasher = hashlib.blake2b(digest_size=_CACHE_KEY_DIGEST_SIZE)
+        for description in prompt:
+            hasher.update(_normalize_prompt(description).encode('utf-8'))
+            hasher.update(b'\x00')
+        key_data['batch'] = len(prompt)
+        hasher.update(_canonical_json(key_data))
+        return hasher.hexdigest()
+    key_data['prompt'] = _normalize_prompt(prompt)
+    return hashlib.blake2b(_canonical_json(key_data), digest_size=_CACHE_KEY_DIGEST_SIZE).hexdigest()
+
+# Process-local LRU in front of the disk cache; hot prompts skip stat/read/parse
+_MEM_CACHE: "OrderedDict[str, dict]" = OrderedDict()
+_MEM_CACHE_MAX = 512
+_MEM_CACHE_LOCK = threading.Lock()
+
+def _mem_cache_put(key: str, data: dict) -> None:
+    with _MEM_CACHE_LOCK:
+        _MEM_CACHE[key] = data
+        _MEM_CACHE.move_to_end(key)
+        while len(_MEM_CACHE) > _MEM_CACHE_MAX:
+            _MEM_CACHE.popitem(last=False)
 
 def _local_cache_get(key: str) -> Optional[dict]:
-    path = LOCAL_CACHE_DIR / f"groq_{key}.json"
-    if path.exists():
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return None
-    return None
+    with _MEM_CACHE_LOCK:
+        hit = _MEM_CACHE.get(key)
+        if hit is not None:
+            _MEM_CACHE.move_to_end(key)
+    if hit is not None:
+        # Callers annotate the result (e.g. 'source'); keep the cached entry pristine
+        return dict(hit)
+    data = _read_disk_cache(key)
+    if data is not None:
+        _mem_cache_put(key, dict(data))
+    return data
+
+def _cache_path(key: str) -> pathlib.Path:
+    # Sharded by the first two hex digits (as git does) so no directory grows unbounded
+    return LOCAL_CACHE_DIR / key[:2] / f"{key[2:]}.json.gz"
+
+def _read_disk_cache(key: str) -> Optional[dict]:
+    path = _cache_path(key)
+    try:
+        return _load_json(gzip.decompress(path.read_bytes()))
+    except Exception:
+        # Missing or unreadable/corrupt entry
+        return None
+
+_SHARDS_READY: set[pathlib.Path] = set()
+
+def _ensure_shard(directory: pathlib.Path) -> None:
+    # mkdir once per shard per process rather than on every write
+    if directory not in _SHARDS_READY:
+        directory.mkdir(exist_ok=True)
+        _SHARDS_READY.add(directory)
 
 def _local_cache_set(key: str, data: dict) -> None:
-    path = LOCAL_CACHE_DIR / f"groq_{key}.json"
+    _mem_cache_put(key, dict(data))
+    path = _cache_path(key)
+    # Write to a per-writer temp file and rename so readers never see partial JSON
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
     try:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _ensure_shard(path.parent)
+        # Level 1: PlantUML text is repetitive, so the fastest level already shrinks entries well
+        tmp.write_bytes(gzip.compress(_canonical_json(data), compresslevel=1, mtime=0))
+        os.replace(tmp, path)
     except Exception:
-        pass
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
 
 PLANTUML_DIAGRAM_TYPES = {'class', 'sequence', 'usecase', 'state', 'activity', 'component', 'communication', 'deployment'}
 FORMAT_TO_TYPES = {
@@ -63,74 +189,99 @@ FORMAT_TO_TYPES = {
 SUPPORTED_DIAGRAM_TYPES = set().union(*FORMAT_TO_TYPES.values())
 
 
-def _is_stub_mode() -> bool:
-    override = os.getenv('STUB_LLM')
+# Every (format, diagram type) combination accepted by generate_diagram_llm
+_ALLOWED_PAIRS = frozenset(
+    (fmt, dt) for fmt, types in FORMAT_TO_TYPES.items() if fmt in SUPPORTED_FORMATS for dt in types
+)
+
+
+@lru_cache(maxsize=8)
+def _parse_stub_flag(override: Optional[str]) -> bool:
     if override is None:
-        return STUB_LLM
+        return _CFG.stub
     return override.strip().lower() in ('1', 'true', 'yes', 'on')
 
 
+def _is_stub_mode() -> bool:
+    # STUB_LLM may be flipped at runtime (see README), so keep the lookup but memoize the parse
+    return _parse_stub_flag(os.environ.get('STUB_LLM'))
+
+
+_STUB_CORE = {
+    'class': "@startuml\nclass User {\n  +UUID id\n  +string email\n}\nclass Admin\nUser <|-- Admin\n@enduml",
+    'sequence': "@startuml\nactor User\nparticipant System\nUser -> System : describe requirements\nSystem -->> User : generated diagram\n@enduml",
+    'usecase': "@startuml\nactor User\nrectangle System {\n  usecase ManageRequirements\n}\nUser --> ManageRequirements\n@enduml",
+    'state': "@startuml\n[*] --> Draft\nDraft --> Generated : request\nGenerated --> [*] : deliver\n@enduml",
+    'activity': "@startuml\nstart\n:Collect requirements;\n:Design solution;\n:Review with stakeholders;\nstop\n@enduml",
+}
+_STUB_DEFAULT = "@startuml\nnote left\nLLM stubbed due to configuration\nend note\n@enduml"
+
+
 def _stub_diagram(diagram_type: str, *, output_format: str) -> str:
-    core = {
-        'class': "@startuml\nclass User {\n  +UUID id\n  +string email\n}\nclass Admin\nUser <|-- Admin\n@enduml",
-        'sequence': "@startuml\nactor User\nparticipant System\nUser -> System : describe requirements\nSystem -->> User : generated diagram\n@enduml",
-        'usecase': "@startuml\nactor User\nrectangle System {\n  usecase ManageRequirements\n}\nUser --> ManageRequirements\n@enduml",
-        'state': "@startuml\n[*] --> Draft\nDraft --> Generated : request\nGenerated --> [*] : deliver\n@enduml",
-        'activity': "@startuml\nstart\n:Collect requirements;\n:Design solution;\n:Review with stakeholders;\nstop\n@enduml",
-    }
-    return core.get(diagram_type, "@startuml\nnote left\nLLM stubbed due to configuration\nend note\n@enduml")
+    return _STUB_CORE.get(diagram_type, _STUB_DEFAULT)
+
+@lru_cache(maxsize=64)
+def _cached_stub_diagram(diagram_type: str, output_format: str) -> Dict[str, str]:
+    """Normalized stub output; deterministic per (type, format) so computed once."""
+    return _normalize_diagram(_stub_diagram(diagram_type, output_format=output_format), diagram_type, output_format)
+
+
+def _normalized_stub(diagram_type: str, output_format: str) -> Dict[str, str]:
+    """Return a fresh copy of the cached normalized stub so callers may mutate it."""
+    return dict(_cached_stub_diagram(diagram_type, output_format))
+
+
+def _flatten_activity_lines(lines: List[str]) -> List[str]:
+    """Drop block/swimlane syntax from an activity diagram, keeping actions and arrows."""
+    flat = []
+    for l in lines:
+        stripped = l.strip()
+        if '{' in l or '}' in l or stripped.startswith('|'):
+            continue
+        if (':' in l or '-->' in l or '->' in l or stripped in ("start", "stop")):
+            flat.append(l)
+    if not flat or not any('@startuml' in x for x in flat):
+        flat = ['@startuml'] + flat
+    if not any('@enduml' in x for x in flat):
+        flat = flat + ['@enduml']
+    return flat
+
+
+def _is_valid_plantuml(lines: List[str], diagram_type: str) -> bool:
+    """Basic PlantUML validity checks over the diagram's (unstripped) lines."""
+    lines = [s for s in (l.strip() for l in lines) if s]
+    # Must be wrapped in @startuml ... @enduml
+    if not lines or not lines[0].startswith('@startuml') or not lines[-1].endswith('@enduml'):
+        return False
+    # Loosened: allow more lines and valid nested blocks for state/activity diagrams
+    if diagram_type in ('state', 'activity'):
+        # Only check for forbidden syntax and at least one transition/action
+        if diagram_type == 'state':
+            transitions = [l for l in lines if '-->' in l]
+            if not transitions:
+                return False
+            has_start = any(l.startswith('[*] -->') for l in lines)
+            if not has_start:
+                return False
+            if any(_RE_STATE_FORBIDDEN.search(l) for l in lines):
+                return False
+        elif diagram_type == 'activity':
+            if not any(':' in l or '-->' in l or '->' in l for l in lines):
+                return False
+    elif diagram_type in ('component', 'deployment'):
+        # Allow nested blocks for deployment/component diagrams
+        if diagram_type == 'deployment':
+            has_node = any(l.startswith('node ') for l in lines)
+            has_rel = any('-->' in l or '<--' in l or '..>' in l or '<..' in l for l in lines)
+            if not has_node or not has_rel:
+                return False
+    return True
+
 
 def _normalize_diagram(raw_text: str, diagram_type: str, output_format: str) -> Dict[str, str]:
     # Debug: Log raw LLM output for key diagram types
-    import logging
     if diagram_type in ("activity", "state", "deployment"):
-        logger = logging.getLogger("plantuml.llm.raw_output")
-        logger.warning(f"Raw LLM output for {diagram_type} diagram:\n{raw_text}\n---END RAW---")
-    def _flatten_plantuml(diagram: str, diagram_type: str) -> str:
-        # Only flatten activity diagrams if needed; preserve structure for state and deployment
-        if diagram_type != "activity":
-            return diagram
-        lines = diagram.splitlines()
-        flat = []
-        for l in lines:
-            if '{' in l or '}' in l or l.strip().startswith('|'):
-                continue
-            if (':' in l or '-->' in l or '->' in l or l.strip() in ("start", "stop")):
-                flat.append(l)
-        if not flat or not any('@startuml' in x for x in flat):
-            flat = ['@startuml'] + flat
-        if not any('@enduml' in x for x in flat):
-            flat = flat + ['@enduml']
-        return '\n'.join(flat)
-    def _is_valid_plantuml(diagram: str, diagram_type: str) -> bool:
-        # Basic checks for PlantUML validity
-        if not diagram.strip().startswith('@startuml') or not diagram.strip().endswith('@enduml'):
-            return False
-        lines = [l.strip() for l in diagram.splitlines() if l.strip()]
-        # Loosened: allow more lines and valid nested blocks for state/activity diagrams
-        if diagram_type in ('state', 'activity'):
-            # Only check for forbidden syntax and at least one transition/action
-            if diagram_type == 'state':
-                transitions = [l for l in lines if '-->' in l]
-                if not transitions:
-                    return False
-                has_start = any(l.startswith('[*] -->') for l in lines)
-                if not has_start:
-                    return False
-                forbidden = ['class ', 'node ', 'component ', 'package ', 'artifact ', 'database ', 'cloud ']
-                if any(any(f in l for f in forbidden) for l in lines):
-                    return False
-            elif diagram_type == 'activity':
-                if not any(':' in l or '-->' in l or '->' in l for l in lines):
-                    return False
-        elif diagram_type in ('component', 'deployment'):
-            # Allow nested blocks for deployment/component diagrams
-            if diagram_type == 'deployment':
-                has_node = any(l.startswith('node ') for l in lines)
-                has_rel = any('-->' in l or '<--' in l or '..>' in l or '<..' in l for l in lines)
-                if not has_node or not has_rel:
-                    return False
-        return True
+        _RAW_OUTPUT_LOGGER.warning(f"Raw LLM output for {diagram_type} diagram:\n{raw_text}\n---END RAW---")
     raw = (raw_text or '').strip()
     if not raw:
         return {'diagram': '', 'raw_diagram': ''}
@@ -147,19 +298,27 @@ def _normalize_diagram(raw_text: str, diagram_type: str, output_format: str) ->
             if candidate:
                 text = candidate
                 break
-    lower = text.lower()
-    start_idx = lower.find('@startuml')
-    end_idx = lower.rfind('@enduml')
+    # First @startuml and last @enduml, found case-insensitively without lowercasing a copy
+    start_idx = end_idx = -1
+    for match in _UML_BOUNDARY.finditer(text):
+        if match.group(1):
+            if start_idx == -1:
+                start_idx = match.start()
+        else:
+            end_idx = match.start()
     if start_idx != -1 and end_idx != -1:
         cleaned = text[start_idx:end_idx + len('@enduml')].strip()
     else:
-        cleaned = text.strip()
+        # `text` is already stripped (either `raw` or a stripped fenced segment)
+        cleaned = text
         if not cleaned.startswith('@startuml'):
             cleaned = '@startuml\n' + cleaned
         if not cleaned.endswith('@enduml'):
-            cleaned = cleaned.rstrip() + '\n@enduml'
+            cleaned = cleaned + '\n@enduml'
+
+    # Split once; `lines` tracks the line list behind `cleaned` for the checks below
+    lines = cleaned.splitlines()
 
-    import re
     # PlantUML: only strict filtering for deployment diagrams
     if diagram_type == 'deployment':
         # Do not filter out valid PlantUML lines; just check validity at the end
@@ -168,60 +327,68 @@ def _normalize_diagram(raw_text: str, diagram_type: str, output_format: str) ->
         # Do not filter out valid PlantUML lines; just check validity at the end
         pass
     elif diagram_type == 'state':
-        lines = cleaned.splitlines()
         # Only filter forbidden diagram types, not PlantUML state syntax
-        forbidden = ['class ', 'node ', 'component ', 'package ', 'artifact ', 'database ', 'cloud ']
-        filtered = [l for l in lines if not any(f in l for f in forbidden)]
+        filtered = [l for l in lines if not _RE_STATE_FORBIDDEN.search(l)]
         has_transition = any('-->' in l for l in filtered)
         has_start = any(l.strip().startswith('[*] -->') for l in filtered)
         if not has_transition or not has_start:
             # Synthesize minimal state diagram from prompt
             state = 'StateFromPrompt' if not raw else raw.split()[0]
-            cleaned = f'@startuml\n[*] --> {state}\n@enduml'
+            lines = ['@startuml', f'[*] --> {state}', '@enduml']
         else:
-            cleaned = '\n'.join(filtered)
+            lines = filtered
+        cleaned = '\n'.join(lines)
     elif diagram_type == 'activity':
-        lines = cleaned.splitlines()
-        # Remove forbidden lines and empty actions
-        forbidden = [':@startuml;', ':@enduml;', 'class ', 'node ', 'component ', 'package ', 'artifact ', 'database ', 'cloud ']
-        filtered = [l for l in lines if not any(f in l.lower() for f in forbidden)]
-        # Remove empty or trivial actions (e.g., ': ;')
-        filtered = [l for l in filtered if not l.strip().startswith(': ;') and l.strip()]
-        has_action = any(':' in l and l.strip() not in (':@startuml;', ':@enduml;') for l in filtered)
-        prompt_lower = (raw or '').lower()
+        # Remove forbidden lines and empty or trivial actions (e.g., ': ;')
+        filtered = []
+        has_action = False
+        for l in lines:
+            stripped = l.strip()
+            if not stripped or stripped.startswith(': ;'):
+                continue
+            if _RE_ACTIVITY_FORBIDDEN.search(l.lower()):
+                continue
+            filtered.append(l)
+            if ':' in l and stripped not in (':@startuml;', ':@enduml;'):
+                has_action = True
         if not has_action:
             # Synthesize minimal ATM activity diagram for ATM prompts
-            if 'atm' in prompt_lower:
+            if 'atm' in raw.lower():
                 cleaned = ("""@startuml\nstart\n:Insert card;\n:Enter PIN;\n:Select transaction;\n:Process transaction;\nstop\n@enduml""")
             else:
                 cleaned = '@startuml\nstart\n:Process;\nstop\n@enduml'
+            lines = cleaned.splitlines()
         else:
-            cleaned = '\n'.join(filtered)
+            lines = filtered
+            cleaned = '\n'.join(lines)
     elif diagram_type == 'class':
-        lines = cleaned.splitlines()
-        classes = [re.findall(r'class ([^\s{]+)', l) for l in lines]
+        classes = [_RE_CLASS_DECL.findall(l) for l in lines]
         classes = [c[0] for c in classes if c]
         has_rel = any('<|--' in l or '--' in l or '..' in l for l in lines)
         if not classes:
             # Synthesize minimal class diagram
-            class_name = 'Entity' if not raw or raw.strip().lower() in ('atm', 'atm case study') else raw.split()[0]
-            cleaned = f'@startuml\nclass {class_name}\n@enduml'
+            class_name = 'Entity' if not raw or raw.lower() in ('atm', 'atm case study') else raw.split()[0]
+            lines = ['@startuml', f'class {class_name}', '@enduml']
+            cleaned = '\n'.join(lines)
         elif not has_rel and len(classes) >= 2:
-            cleaned = '\n'.join(lines + [f'{classes[0]} <|-- {classes[1]}'])
+            lines = lines + [f'{classes[0]} <|-- {classes[1]}']
+            cleaned = '\n'.join(lines)
         elif not has_rel and len(classes) == 1:
-            cleaned = '\n'.join(lines + [f'{classes[0]} <|-- {classes[0]}'])
+            lines = lines + [f'{classes[0]} <|-- {classes[0]}']
+            cleaned = '\n'.join(lines)
     else:
-        cleaned_lines = [l for l in cleaned.splitlines() if l.strip() != '' and not l.strip().startswith('!invalid!')]
-        cleaned = '\n'.join(cleaned_lines)
+        lines = [l for l, s in zip(lines, map(str.strip, lines)) if s and not s.startswith('!invalid!')]
+        cleaned = '\n'.join(lines)
 
     # Robust post-processing: flatten only for activity diagrams
     if diagram_type == "activity":
-        cleaned_flat = _flatten_plantuml(cleaned, diagram_type)
-        if _is_valid_plantuml(cleaned_flat, diagram_type):
-            cleaned = cleaned_flat
+        flat = _flatten_activity_lines(lines)
+        if _is_valid_plantuml(flat, diagram_type):
+            lines = flat
+            cleaned = '\n'.join(flat)
     # Final validation: fallback to minimal valid diagram if not valid
     # Only use fallback if LLM output is empty or invalid
-    if not _is_valid_plantuml(cleaned, diagram_type):
+    if not _is_valid_plantuml(lines, diagram_type):
         prompt_lower = (raw or '').lower()
         if diagram_type == 'state':
             state = 'State' if not raw or 'atm' in prompt_lower else raw.split()[0]
@@ -242,126 +409,33 @@ def _normalize_diagram(raw_text: str, diagram_type: str, output_format: str) ->
             cleaned = f'@startuml\ncomponent {comp}\n{comp} --> {comp}\n@enduml'
     return {'diagram': cleaned, 'raw_diagram': raw}
 
-    starter = MERMAID_STARTERS.get(diagram_type, 'graph TD')
-    text = raw
-    if '```' in text:
-        segments = text.split('```')
-        for segment in segments:
-            candidate = segment.strip()
-            if not candidate:
-                continue
-            if candidate.lower().startswith('mermaid'):
-                lines = candidate.splitlines()
-                candidate = '\n'.join(lines[1:]).strip()
-                text = candidate
-                break
-    if text.lower().startswith('mermaid'):
-        text = '\n'.join(text.splitlines()[1:]).strip()
-    cleaned = text.strip()
-    if cleaned and cleaned.splitlines()[0].strip().lower().startswith('```'):
-        cleaned = '\n'.join(cleaned.splitlines()[1:]).strip()
-
-    # Post-process Mermaid syntax to fix common LLM errors
-    cleaned = _fix_mermaid_syntax(cleaned, diagram_type)
-
-    # If output is just the starter or empty, synthesize a minimal diagram from the prompt
-    if not cleaned or cleaned.strip() == starter.strip():
-        # Use the first word of the prompt as a node label
-        node = raw.split()[0] if raw else 'Node'
-        cleaned = f'{starter}\n{node}((Generated from prompt))'
-    raw_block = raw if raw.startswith('```') else f"```mermaid\n{cleaned}\n```"
-    return {'diagram': cleaned.strip(), 'raw_diagram': raw_block.strip()}
-
-
-def _fix_mermaid_syntax(text: str, diagram_type: str) -> str:
-    """Fix common Mermaid syntax errors generated by LLM."""
-    lines = text.split('\n')
-    fixed_lines = []
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            fixed_lines.append('')
-            continue
 
-        # Fix activity diagram node syntax - convert ((label)) to ([label])
-        if diagram_type == 'activity':
-            import re
-            line = re.sub(r'\(\(([^)]+)\)\)', r'([\1])', line)
-            line = re.sub(r'\(\([^)]*\)\)', lambda m: f"([{m.group(0)[2:-2]}])", line)
-
-        # Fix communication diagram - ensure it uses sequenceDiagram syntax
-        elif diagram_type == 'communication':
-            if 'flowchart' in text.lower() and 'participant' in line.lower():
-                if line.lower().startswith('participant'):
-                    pass
-                elif '-->' in line or '->>' in line:
-                    pass
-                else:
-                    continue
-            if line.lower().strip() == 'flowchart td':
-                continue
+def _resolve_target(diagram_type: str, output_format: str) -> tuple[str, str]:
+    """Normalize and validate the requested diagram type/format pair."""
+    diagram_key = diagram_type.lower().strip()
+    fmt = output_format.lower().strip()
+    if (fmt, diagram_key) in _ALLOWED_PAIRS:
+        return diagram_key, fmt
+    if fmt not in SUPPORTED_FORMATS:
+        valid_formats = ', '.join(sorted(SUPPORTED_FORMATS))
+        raise ValueError(f"Unsupported output_format '{output_format}'. Valid options: {valid_formats}")
 
-        # Fix use case diagram - ensure flowchart syntax
-        elif diagram_type == 'usecase':
-            if line.lower().startswith('usecasediagram'):
-                line = 'flowchart TD'
-            elif line.lower().startswith('actor '):
-                parts = line.split()
-                if len(parts) >= 2:
-                    actor_name = parts[1]
-                    line = f'{actor_name}([{actor_name}])'
-            elif line.lower().startswith('usecase '):
-                parts = line.split()
-                if len(parts) >= 2:
-                    usecase_name = parts[1]
-                    line = f'{usecase_name}["{usecase_name}"]'
-
-        # Fix component and deployment diagrams: remove sequence/participant lines, fix subgraph usage
-        elif diagram_type in ('component', 'deployment'):
-            # Remove participant/sequence lines
-            if line.lower().startswith('participant') or '->>' in line or '-->>' in line:
-                continue
-            # Remove sequenceDiagram/flowchart TD if mixed
-            if line.lower().startswith('sequencediagram') or line.lower().startswith('flowchart td'):
-                continue
-            # Remove invalid subgraph endings
-            if line.lower() == 'end' and not fixed_lines:
-                continue
-            # Remove empty subgraphs
-            if line.lower().startswith('subgraph') and (len(lines) > 1 and lines[lines.index(line)+1].lower() == 'end'):
-                continue
-            # Remove lines with only node names (e.g., atm, cardReader)
-            if len(line.split()) == 1 and line.islower():
-                continue
+    allowed_types = FORMAT_TO_TYPES.get(fmt, set())
+    if diagram_key not in allowed_types:
+        valid = ', '.join(sorted(allowed_types))
+        raise ValueError(f"Unsupported diagram_type '{diagram_type}' for format '{fmt}'. Valid options: {valid}")
+    return diagram_key, fmt
 
-        fixed_lines.append(line)
-
-    # Post-process the entire diagram for communication diagrams
-    if diagram_type == 'communication':
-        result = '\n'.join(fixed_lines)
-        if 'flowchart td' in result.lower() and 'participant' in result.lower():
-            result = result.replace('flowchart TD', 'sequenceDiagram')
-            lines = result.split('\n')
-            sequence_lines = []
-            for line in lines:
-                line_lower = line.lower().strip()
-                if (line_lower.startswith('participant') or
-                    '->>' in line or '-->>' in line or
-                    'note ' in line_lower or
-                    'activate ' in line_lower or
-                    'deactivate ' in line_lower or
-                    'alt ' in line_lower or
-                    'loop ' in line_lower or
-                    'opt ' in line_lower or
-                    'par ' in line_lower or
-                    line_lower in ['end', 'else'] or
-                    not line.strip()):
-                    sequence_lines.append(line)
-            result = '\n'.join(sequence_lines)
-        return result
 
-    return '\n'.join(fixed_lines)
+def _system_message(diagram_key: str) -> str:
+    return (
+        f'You are an expert UML architect. Generate only PlantUML code for the requested diagram type: {diagram_key}. '
+        f'For activity diagrams, do NOT use any class diagram syntax (no "class", "--", "*--", "<|--"). Use only PlantUML activity diagram syntax: "start", "stop", ":action;", decisions, and transitions. '
+        f'For deployment diagrams, use only PlantUML deployment diagram syntax (node, artifact, database, cloud, and relationships). Do not use class or component diagram syntax. '
+        f'For class diagrams, use only PlantUML class diagram syntax. Do not use activity, deployment, or component diagram syntax. '
+        'Return only PlantUML code, no explanations, no markdown, no extra text.'
+    )
+
 
 def generate_diagram_llm(
     user_prompt: str,
@@ -377,24 +451,12 @@ def generate_diagram_llm(
 ) -> Dict[str, Any]:
     """Generate diagram code from a natural language description using Groq LLM, with local cache, batching, and fallback."""
     if batch_descriptions and isinstance(batch_descriptions, list) and batch_descriptions:
-        # Batch all descriptions into a single prompt
-        combined_prompt = '\n'.join(batch_descriptions)
-        prompt_for_cache = combined_prompt
+        # Batch all descriptions into a single prompt; the cache key hashes them individually
+        prompt_for_cache: Union[str, List[str]] = batch_descriptions
     else:
-        combined_prompt = user_prompt
         prompt_for_cache = user_prompt
 
-
-    diagram_key = diagram_type.lower().strip()
-    fmt = output_format.lower().strip()
-    if fmt not in SUPPORTED_FORMATS:
-        valid_formats = ', '.join(sorted(SUPPORTED_FORMATS))
-        raise ValueError(f"Unsupported output_format '{output_format}'. Valid options: {valid_formats}")
-
-    allowed_types = FORMAT_TO_TYPES.get(fmt, set())
-    if diagram_key not in allowed_types:
-        valid = ', '.join(sorted(allowed_types))
-        raise ValueError(f"Unsupported diagram_type '{diagram_type}' for format '{fmt}'. Valid options: {valid}")
+    diagram_key, fmt = _resolve_target(diagram_type, output_format)
 
     # BYPASS LLM for component and deployment diagrams: synthesize from schema
     if diagram_key in ("component", "deployment") and fmt == "plantuml":
@@ -425,10 +487,9 @@ def generate_diagram_llm(
         return cached
 
     # Handle stub mode or disabled client early
-    if stub_mode or not GROQ_CLIENT.enabled or not GROQ_CLIENT.api_key:
+    if stub_mode or not _CFG.client_ready:
         reason = 'stub' if stub_mode else 'disabled'
-        raw_stub = _stub_diagram(diagram_key, output_format=fmt)
-        normalized = _normalize_diagram(raw_stub, diagram_key, fmt)
+        normalized = _normalized_stub(diagram_key, fmt)
         result = {
             'diagram': normalized['diagram'],
             'raw_diagram': normalized['raw_diagram'],
@@ -437,13 +498,14 @@ def generate_diagram_llm(
             'source': reason,
             'warnings': [
                 'LLM call skipped because STUB_LLM is enabled.'
-                if STUB_LLM
+                if _CFG.stub
                 else 'Groq client disabled or missing API key; returned stub diagram.'
             ]
         }
         _local_cache_set(cache_key, result)
         return result
 
+    combined_prompt = '\n'.join(batch_descriptions) if isinstance(prompt_for_cache, list) else user_prompt
     prompt = build_plantuml_prompt(
         combined_prompt,
         diagram_type=diagram_key,
@@ -459,13 +521,7 @@ def generate_diagram_llm(
         'messages': [
             {
                 'role': 'system',
-                'content': (
-                    f'You are an expert UML architect. Generate only PlantUML code for the requested diagram type: {diagram_key}. '
-                    f'For activity diagrams, do NOT use any class diagram syntax (no "class", "--", "*--", "<|--"). Use only PlantUML activity diagram syntax: "start", "stop", ":action;", decisions, and transitions. '
-                    f'For deployment diagrams, use only PlantUML deployment diagram syntax (node, artifact, database, cloud, and relationships). Do not use class or component diagram syntax. '
-                    f'For class diagrams, use only PlantUML class diagram syntax. Do not use activity, deployment, or component diagram syntax. '
-                    'Return only PlantUML code, no explanations, no markdown, no extra text.'
-                ),
+                'content': _system_message(diagram_key),
             },
             {
                 'role': 'user',
@@ -473,7 +529,7 @@ def generate_diagram_llm(
             },
         ],
         'temperature': temperature,
-        'max_tokens': 4096,
+        'max_tokens': _SINGLE_MAX_TOKENS,
     }
 
     try:
@@ -494,7 +550,7 @@ def generate_diagram_llm(
         return result
     except GroqClientDisabledError as err:
         logger.warning('Groq client disabled: %s', err)
-        normalized = _normalize_diagram(_stub_diagram(diagram_key, output_format=fmt), diagram_key, fmt)
+        normalized = _normalized_stub(diagram_key, fmt)
         result = {
             'diagram': normalized['diagram'],
             'raw_diagram': normalized['raw_diagram'],
@@ -507,7 +563,7 @@ def generate_diagram_llm(
         return result
     except GroqClientError as err:
         logger.error('Groq API error: %s', err)
-        normalized = _normalize_diagram(_stub_diagram(diagram_key, output_format=fmt), diagram_key, fmt)
+        normalized = _normalized_stub(diagram_key, fmt)
         result = {
             'diagram': normalized['diagram'],
             'raw_diagram': normalized['raw_diagram'],
@@ -521,7 +577,7 @@ def generate_diagram_llm(
         return result
     except Exception as exc:
         logger.exception('Failed to generate diagram via LLM')
-        normalized = _normalize_diagram(_stub_diagram(diagram_key, output_format=fmt), diagram_key, fmt)
+        normalized = _normalized_stub(diagram_key, fmt)
         result = {
             'diagram': normalized['diagram'],
             'raw_diagram': normalized['raw_diagram'],
@@ -535,6 +591,169 @@ def generate_diagram_llm(
         return result
 
 
+def generate_diagrams_llm_batch(
+    prompts: List[str],
+    *,
+    diagram_type: str = 'class',
+    output_format: str = 'plantuml',
+    context: Optional[Dict[str, Any]] = None,
+    schema: Optional[Dict[str, Any]] = None,
+    style_preferences: Optional[Dict[str, Any]] = None,
+    focus: Optional[list[str]] = None,
+    temperature: float = 0.15,
+) -> List[Dict[str, Any]]:
+    """Generate one diagram per prompt, sharing a single Groq round-trip for the cache misses.
+
+    Results are returned in the same order as ``prompts``. Uncached prompts are sent
+    together (up to ``_BATCH_CHUNK`` per request) as numbered goals under one shared
+    prompt, and the response is split on ``=== DIAGRAM i ===`` markers; if the model does
+    not return one usable diagram per prompt, the chunk falls back to parallel
+    single-prompt calls.
+    """
+    if not prompts:
+        return []
+    diagram_key, fmt = _resolve_target(diagram_type, output_format)
+    options = dict(
+        diagram_type=diagram_key,
+        output_format=fmt,
+        context=context,
+        schema=schema,
+        style_preferences=style_preferences,
+        focus=focus,
+        temperature=temperature,
+    )
+
+    # Synthesized, stubbed and disabled paths never reach the network
+    if (
+        diagram_key in ("component", "deployment")
+        or _is_stub_mode()
+        or not _CFG.client_ready
+    ):
+        return [generate_diagram_llm(p, **options) for p in prompts]
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(prompts)
+    misses = []
+    for idx, p in enumerate(prompts):
+        cache_key = _local_cache_key(p, diagram_key, fmt, context, schema, style_preferences, focus)
+        cached = _local_cache_get(cache_key)
+        if cached:
+            cached['source'] = 'local-cache'
+            results[idx] = cached
+        else:
+            misses.append((idx, cache_key))
+
+    # Context, schema and guidance are rendered once around a placeholder goal; each
+    # chunk splices its numbered goals in between
+    template = None
+    if len(misses) > 1:
+        template = build_plantuml_prompt(
+            '\x00',
+            diagram_type=diagram_key,
+            output_format=fmt,
+            context=context,
+            schema=schema,
+            style_preferences=style_preferences,
+            focus=focus,
+        ).partition('\x00')
+
+    for start in range(0, len(misses), _BATCH_CHUNK):
+        chunk = misses[start:start + _BATCH_CHUNK]
+        diagrams = _call_batched(
+            [prompts[idx] for idx, _ in chunk], template, diagram_key, fmt, temperature,
+        ) if len(chunk) > 1 else None
+        if diagrams is None:
+            with ThreadPoolExecutor(max_workers=min(_BATCH_MAX_WORKERS, len(chunk))) as pool:
+                singles = list(pool.map(lambda item: generate_diagram_llm(prompts[item[0]], **options), chunk))
+            for (idx, _), result in zip(chunk, singles):
+                results[idx] = result
+            continue
+        for (idx, cache_key), normalized in zip(chunk, diagrams):
+            result = {
+                'diagram': normalized['diagram'],
+                'raw_diagram': normalized['raw_diagram'],
+                'diagram_type': diagram_key,
+                'format': fmt,
+                'source': 'groq',
+                'model': DEFAULT_MODEL,
+            }
+            _local_cache_set(cache_key, result)
+            results[idx] = result
+    return results
+
+
+def _call_batched(
+    prompts: List[str],
+    template: Tuple[str, str, str],
+    diagram_key: str,
+    fmt: str,
+    temperature: float,
+) -> Optional[List[Dict[str, str]]]:
+    """Request ``len(prompts)`` diagrams in one payload; ``None`` if the reply can't be split cleanly.
+
+    ``template`` is the shared prompt partitioned around its goal placeholder.
+    """
+    prefix, _, suffix = template
+    # Continuation lines take the placeholder's indentation so the list stays aligned
+    indent = prefix[prefix.rfind('\n') + 1:]
+    goals = ('\n' + indent).join(f"{number}. {' '.join(p.split())}" for number, p in enumerate(prompts, 1))
+    instructions = (
+        f"The user goal below lists {len(prompts)} numbered requests. Produce {len(prompts)} separate diagrams, "
+        "one per request, each following all of the instructions that follow. "
+        "Before each diagram emit a line of the form '=== DIAGRAM i ===' where i is the request number, "
+        "followed by that diagram's complete @startuml ... @enduml block."
+    )
+    payload = {
+        'model': DEFAULT_MODEL,
+        'messages': [
+            {
+                'role': 'system',
+                'content': _system_message(diagram_key),
+            },
+            {
+                'role': 'user',
+                'content': instructions + '\n\n' + prefix + goals + suffix,
+            },
+        ],
+        'temperature': temperature,
+        'max_tokens': min(_BATCH_TOKENS_PER_DIAGRAM * len(prompts), _BATCH_MAX_TOKENS),
+    }
+    try:
+        data = GROQ_CLIENT.call(payload)
+    except GroqClientError as err:
+        logger.warning('Batched Groq call failed, retrying prompts individually: %s', err)
+        return None
+    try:
+        choice = (data.get('choices') or [{}])[0]
+        message = choice.get('message')
+        text = message.get('content') if isinstance(message, dict) else None
+        truncated = choice.get('finish_reason') == 'length'
+    except (AttributeError, IndexError, TypeError) as err:
+        logger.warning('Unexpected batched Groq reply shape, retrying prompts individually: %s', err)
+        return None
+    if not isinstance(text, str):
+        logger.warning('Batched Groq reply had no text content, retrying prompts individually')
+        return None
+    if truncated:
+        # _normalize_diagram would close a cut-off diagram and it would be cached as good
+        logger.warning('Batched Groq reply hit the token limit, retrying prompts individually')
+        return None
+
+    parts = _RE_BATCH_SENTINEL.split(text)
+    bodies: Dict[int, str] = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        bodies.setdefault(int(number), body)
+    if sorted(bodies) != list(range(1, len(prompts) + 1)):
+        logger.warning('Batched Groq reply had %d diagram sections for %d prompts', len(bodies), len(prompts))
+        return None
+    if not all('@enduml' in body.lower() for body in bodies.values()):
+        logger.warning('Batched Groq reply had an unterminated diagram, retrying prompts individually')
+        return None
+    diagrams = [_normalize_diagram(bodies[number], diagram_key, fmt) for number in range(1, len(prompts) + 1)]
+    if not all(d['diagram'] for d in diagrams):
+        return None
+    return diagrams
+
+
 def generate_plantuml_llm(
     user_prompt: str,
     *,
@@ -561,4 +780,4 @@ def generate_plantuml_llm(
     )
 
 
-__all__ = ['generate_diagram_llm', 'generate_plantuml_llm', 'SUPPORTED_DIAGRAM_TYPES', 'FORMAT_TO_TYPES']
+__all__ = ['generate_diagram_llm', 'generate_diagrams_llm_batch', 'generate_plantuml_llm', 'SUPPORTED_DIAGRAM_TYPES', 'FORMAT_TO_TYPES']
@@ -6,12 +6,175 @@ Main class for generating PlantUML diagrams from code analysis results
 import logging
 import re
 from collections import Counter
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from itertools import chain, islice
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from .class_diagram_builder import ClassDiagramBuilder
 
 logger = logging.getLogger(__name__)
 
+# Schemas are decoded JSON, so per-entry guards below use exact ``type(x) is dict/list``
+# checks; the public entry points (generate/validate_schema) still use isinstance.
+_LANGUAGE_KEYS = ('python', 'java', 'csharp', 'javascript', 'typescript', 'cpp', 'c')
+_CLASS_SOURCE_KEYS = _LANGUAGE_KEYS + ('classes',)
+
+# Canonical spellings of the common HTTP verbs, so endpoint labels skip str.upper() for them
+_HTTP_METHOD_UPPER = {
+    spelling: verb
+    for verb in ('GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD', 'OPTIONS')
+    for spelling in (verb, verb.lower())
+}
+
+# Runs of '_'/'-', or the gap before a non-leading capital: both become a single space
+_RE_WORD_BREAK = re.compile(r'[_\-]+|(?<!^)(?=[A-Z])')
+_RE_STATEFUL_FIELD = re.compile(r'state|status|phase|mode', re.IGNORECASE)
+# Line boundaries other than \n recognised by str.splitlines() for ASCII text
+_RE_OTHER_LINE_BREAK = re.compile(r'[\r\v\f\x1c-\x1e]')
+
+
+_IDENT_TABLE_MAX = 4096
+
+
+class _IdentTable(dict):
+    """``str.translate`` table mapping every non-alphanumeric code point to ``_``.
+
+    Entries are filled in on first sight, so ``str.isalnum`` semantics (including
+    non-ASCII letters and digits) are kept while repeat lookups stay in C.
+    """
+
+    def __missing__(self, codepoint: int) -> int:
+        value = codepoint if chr(codepoint).isalnum() else 0x5F
+        if len(self) < _IDENT_TABLE_MAX:
+            self[codepoint] = value
+        return value
+
+
+_IDENT_TABLE = _IdentTable()
+
+
+def _ident(name: str) -> str:
+    """Replace every non-alphanumeric character of ``name`` with ``_``."""
+    return name.translate(_IDENT_TABLE)
+
+
+# Fallback state-block bodies (closing brace included) for classes without explicit states
+_STATEFUL_LIFECYCLE = (
+    "  [*] --> Initialized",
+    "  Initialized --> Active : setState()",
+    "  Active --> Suspended : pause()",
+    "  Suspended --> Active : resume()",
+    "  Active --> Completed : complete()",
+    "  Completed --> [*]",
+    "}",
+)
+_DEFAULT_LIFECYCLE = (
+    "  [*] --> Created",
+    "  Created --> Active : initialize()",
+    "  Active --> Completed : finalize()",
+    "  Completed --> Archived : archive()",
+    "  Archived --> [*]",
+    "}",
+)
+
+# Fixed bodies for the component/deployment diagrams
+_COMPONENT_FALLBACK = (
+    "component Frontend",
+    "component API",
+    "component AuthService",
+    "component Database",
+    "",
+    "Frontend --> API : HTTP",
+    "API --> AuthService : Auth",
+    "API --> Database : queries",
+)
+_DEPLOYMENT_ENDPOINT_NODES = (
+    "node \"Web Server\" {",
+    "  component API",
+    "}",
+    "",
+    "node \"Database Server\" {",
+    "  database Database",
+    "}",
+    "",
+    "API --> Database : queries",
+)
+_DEPLOYMENT_FALLBACK = (
+    "node \"Client Machine\" {",
+    "  artifact App",
+    "}",
+    "",
+    "node \"Web Server\" {",
+    "  component Frontend",
+    "}",
+    "",
+    "node \"API Server\" {",
+    "  component API",
+    "  component AuthService",
+    "}",
+    "",
+    "node \"Database Server\" {",
+    "  database Database",
+    "}",
+    "",
+    "App --> Frontend : HTTP",
+    "Frontend --> API : REST",
+    "API --> AuthService : Auth",
+    "API --> Database : queries",
+)
+_SEQUENCE_FALLBACK = (
+    "actor User",
+    "participant System",
+    "User -> System: Request",
+    "System --> User: Response",
+    "",
+)
+_COMMUNICATION_FALLBACK = (
+    "participant Client",
+    "participant API",
+    "participant Database",
+    "",
+    "Client -> API : 1. call endpoint",
+    "API -> Database : 2. query",
+    "Database --> API : 3. result",
+    "API --> Client : 4. response",
+)
+
+# Complete fallback diagrams after the theme header, for schemas without usable data;
+# they depend on nothing else, so each is joined once here
+_FALLBACKS: Dict[str, str] = {
+    kind: "\n".join((f"' {title} Diagram", "", *body, "@enduml"))
+    for kind, title, body in (
+        ('sequence', 'Sequence', _SEQUENCE_FALLBACK),
+        ('communication', 'Communication', _COMMUNICATION_FALLBACK),
+        ('component', 'Component', _COMPONENT_FALLBACK),
+        ('deployment', 'Deployment', _DEPLOYMENT_FALLBACK),
+    )
+}
+
+
+# Class and method names recur across diagrams of the same schema
+@lru_cache(maxsize=4096)
+def _split_identifier_text(text: str) -> str:
+    """Split a snake/kebab/camelCase identifier into title-cased words."""
+    # Plain words ("user", "Order") have nothing to split; islower() is False for any
+    # interior capital, so those still take the regex path
+    if '_' not in text and '-' not in text and text[1:].islower():
+        return text.strip().title() or "Item"
+    return _RE_WORD_BREAK.sub(' ', text).strip().title() or "Item"
+
+
+def _has_state_field(cls: Dict[str, Any]) -> bool:
+    return any(_RE_STATEFUL_FIELD.search(str(field)) for field in cls.get('fields') or [])
+
+
+def _has_language_classes(schema: Dict[str, Any]) -> bool:
+    """True if any language bucket of ``schema`` is a non-empty list."""
+    for value in map(schema.get, _LANGUAGE_KEYS):
+        if isinstance(value, list) and value:
+            return True
+    return False
+
 
 class PlantUMLGenerator:
     """Main PlantUML generator class."""
@@ -22,30 +185,53 @@ class PlantUMLGenerator:
         self.class_builder = ClassDiagramBuilder(config)
         logger.info("PlantUMLGenerator initialized with theme: %s", self.theme)
 
+    @property
+    def theme(self) -> str:
+        return self._theme
+
+    @theme.setter
+    def theme(self, value: str) -> None:
+        self._theme = value
+        # Opening lines shared by every diagram; rebuilt only when the theme changes
+        self._header = ("@startuml", f"!theme {value}")
+        self._header_text = "\n".join(self._header)
+
+    def _emit_fallback(self, kind: str) -> str:
+        """Generic ``kind`` diagram (distinct from the class diagram) under this theme."""
+        return f"{self._header_text}\n{_FALLBACKS[kind]}"
+
+    @staticmethod
+    def _iter_classes(schema: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Yield each class entry of the schema once (first occurrence of a name wins)."""
+        seen: Set[str] = set()
+        sources = [schema.get(key) for key in _CLASS_SOURCE_KEYS]
+        for entry in chain.from_iterable(source for source in sources if type(source) is list):
+            if type(entry) is dict:
+                name = entry.get('class')
+                if name and name not in seen:
+                    seen.add(name)
+                    yield entry
+
     @staticmethod
     def _collect_classes(schema: Dict[str, Any]) -> List[Dict[str, Any]]:
-        classes: Dict[str, Dict[str, Any]] = {}
-        language_keys = ['python', 'java', 'csharp', 'javascript', 'typescript', 'cpp', 'c']
-        for lang in language_keys:
-            entries = schema.get(lang)
-            if isinstance(entries, list):
-                for entry in entries:
-                    if isinstance(entry, dict) and entry.get('class'):
-                        classes.setdefault(entry['class'], entry)
-
-        generic_entries = schema.get('classes')
-        if isinstance(generic_entries, list):
-            for entry in generic_entries:
-                if isinstance(entry, dict) and entry.get('class'):
-                    classes.setdefault(entry['class'], entry)
-
-        return list(classes.values())
+        return list(PlantUMLGenerator._iter_classes(schema))
+
+    @staticmethod
+    def _collect_classes_with_stateful(schema: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Collect classes and, in the same pass, those with state-like fields."""
+        classes: List[Dict[str, Any]] = []
+        stateful: List[Dict[str, Any]] = []
+        for cls in PlantUMLGenerator._iter_classes(schema):
+            classes.append(cls)
+            if _has_state_field(cls):
+                stateful.append(cls)
+        return classes, stateful
 
     @staticmethod
     def _top_classes_by_relations(relations: Iterable[Dict[str, Any]], limit: int = 6) -> List[str]:
         counts: Counter[str] = Counter()
         for relation in relations or []:
-            if not isinstance(relation, dict):
+            if type(relation) is not dict:
                 continue
             frm = relation.get('from')
             to = relation.get('to')
@@ -59,9 +245,7 @@ class PlantUMLGenerator:
     def _split_identifier(identifier: Optional[str]) -> str:
         if not identifier:
             return "Item"
-        text = re.sub(r'[_\-]+', ' ', str(identifier))
-        text = re.sub(r'(?<!^)(?=[A-Z])', ' ', text)
-        return text.strip().title() or "Item"
+        return _split_identifier_text(str(identifier))
 
     def _derive_use_cases(self, schema: Dict[str, Any], limit: int = 6) -> List[Dict[str, str]]:
         derived: List[Dict[str, str]] = []
@@ -98,11 +282,12 @@ class PlantUMLGenerator:
                 'system': cls.get('package') or cls.get('namespace') or 'System'
             })
 
-        if not derived and isinstance(schema.get('endpoints'), list):
-            for endpoint in schema.get('endpoints')[:limit]:
+        endpoints = schema.get('endpoints')
+        if not derived and isinstance(endpoints, list):
+            for endpoint in endpoints[:limit]:
                 method = endpoint.get('method', 'GET')
                 path = endpoint.get('path', '/')
-                label = f"{method.upper()} {path}".strip()
+                label = f"{_HTTP_METHOD_UPPER.get(method) or method.upper()} {path}".strip()
                 derived.append({
                     'label': label,
                     'system': endpoint.get('controller') or endpoint.get('class') or 'API'
@@ -117,6 +302,11 @@ class PlantUMLGenerator:
         """
         Truncate PlantUML output to max_lines and max_bytes, adding a warning note if truncated.
         """
+        # Small ASCII diagrams (the common case) are returned untouched without splitting.
+        # The +8 leaves room for the "@enduml" line appended below when it is missing.
+        if (plantuml.isascii() and len(plantuml) + 8 <= max_bytes
+                and plantuml.count('\n') < max_lines and not _RE_OTHER_LINE_BREAK.search(plantuml)):
+            return plantuml
         lines = plantuml.splitlines()
         truncated = False
         # Step 1: Truncate by line count
@@ -140,9 +330,15 @@ class PlantUMLGenerator:
         # Always ensure @enduml is present at the end
         if not lines or lines[-1].strip().lower() != '@enduml':
             lines.append("@enduml")
-        # Try to fit within max_bytes
-        encoded = lambda lns: "\n".join(lns).encode("utf-8")
-        while len(encoded(lines)) > max_bytes and len(lines) > 5:
+        # Try to fit within max_bytes. Track the encoded size incrementally (one encode per
+        # line, +1 per joining newline) instead of re-encoding the whole diagram per removal.
+        # ASCII input (the usual case; str.isascii() is a flag check) needs no encoding at all
+        if plantuml.isascii():
+            sizes = [len(l) for l in lines]
+        else:
+            sizes = [len(l.encode("utf-8")) for l in lines]
+        total = sum(sizes) + len(lines) - 1
+        if total > max_bytes and len(lines) > 5:
             # Remove lines before the warning note (but keep @startuml and theme)
             # Find warning note or @enduml
             try:
@@ -151,20 +347,22 @@ class PlantUMLGenerator:
                 note_idx = len(lines) - 2  # before @enduml
             # Always keep first 2 lines (@startuml, theme), warning, and @enduml
             keep_head = 2
-            keep_tail = len(lines) - note_idx
-            # Remove one line from before the warning note
-            if note_idx > keep_head:
-                lines = lines[:note_idx-1] + lines[note_idx:]
+            # Each removal takes the line just before the note, so the note shifts down by one;
+            # find how far back to cut, then drop that whole run at once
+            cut = note_idx
+            remaining = len(lines)
+            while total > max_bytes and remaining > 5 and cut > keep_head:
+                cut -= 1
+                total -= sizes[cut] + 1
+                remaining -= 1
+            if cut < note_idx:
+                del lines[cut:note_idx]
                 truncated = True
-            else:
-                # If can't remove more, break
-                break
-        if truncated or len(encoded(lines)) > max_bytes:
+        if truncated or total > max_bytes:
             # If still too big, replace with a minimal error diagram
-            if len(encoded(lines)) > max_bytes:
+            if total > max_bytes:
                 return "\n".join([
-                    "@startuml",
-                    f"!theme {self.theme}",
+                    *self._header,
                     "note as WARNING",
                     f"Diagram too large to render (exceeds {max_bytes} bytes after truncation).",
                     "end note",
@@ -182,8 +380,7 @@ class PlantUMLGenerator:
     def _stateful_classes(classes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         stateful: List[Dict[str, Any]] = []
         for cls in classes:
-            fields = cls.get('fields') or []
-            if any(re.search(r'state|status|phase|mode', str(field), re.IGNORECASE) for field in fields):
+            if _has_state_field(cls):
                 stateful.append(cls)
         return stateful
     
@@ -272,23 +469,21 @@ class PlantUMLGenerator:
         logger.info("Building PlantUML sequence diagram")
         
         def _sanitize(name: str, prefix: str = "P") -> str:
-            base = ''.join(ch if ch.isalnum() else '_' for ch in (name or 'Participant'))
-            base = base or prefix
-            return f"{prefix}_{base}"
+            return f"{prefix}_{_ident(name or 'Participant') or prefix}"
 
         lines = [
-            "@startuml",
-            f"!theme {self.theme}",
+            *self._header,
             "' Sequence Diagram",
             ""
         ]
+        append = lines.append
         
         flows = []
         for key in ('sequence_flows', 'sequenceFlows'):
             value = schema.get(key)
             if isinstance(value, list):
                 flows.extend(value)
-        flows = [flow for flow in flows if isinstance(flow, dict)]
+        flows = [flow for flow in flows if type(flow) is dict]
 
         # Get endpoints for sequence interactions
         endpoints = schema.get('endpoints', [])
@@ -308,15 +503,15 @@ class PlantUMLGenerator:
                 ensure_participant(flow.get('from') or flow.get('initiator') or flow.get('actor') or 'User')
                 ensure_participant(flow.get('to') or flow.get('receiver') or flow.get('component') or 'System')
 
-            emitted_names: Set[str] = set()
-            for label, identifier in participants.items():
-                if label.lower() in ('user', 'actor', 'client'):
-                    lines.append(f"actor {identifier} as \"{label}\"")
-                else:
-                    lines.append(f"participant {identifier} as \"{label}\"")
-                emitted_names.add(label)
+            lines.extend(
+                f"actor {identifier} as \"{label}\""
+                if label.lower() in ('user', 'actor', 'client')
+                else f"participant {identifier} as \"{label}\""
+                for label, identifier in participants.items()
+            )
+            emitted_names: Set[str] = set(participants)
 
-            lines.append("")
+            append("")
 
             for flow in flows[:25]:
                 from_label = flow.get('from') or flow.get('initiator') or flow.get('actor') or 'User'
@@ -331,53 +526,44 @@ class PlantUMLGenerator:
                 arrow = '->>' if call_type in ('sync', 'synchronous') else '-)'
 
                 if from_label not in emitted_names:
-                    lines.append(f"participant {from_id} as \"{from_label}\"")
+                    append(f"participant {from_id} as \"{from_label}\"")
                     emitted_names.add(from_label)
                 if to_label not in emitted_names:
-                    lines.append(f"participant {to_id} as \"{to_label}\"")
+                    append(f"participant {to_id} as \"{to_label}\"")
                     emitted_names.add(to_label)
 
-                lines.append(f"{from_id}{arrow}{to_id}: {message}")
+                append(f"{from_id}{arrow}{to_id}: {message}")
                 if note:
-                    lines.append(f"note over {from_id},{to_id}: {note}")
+                    append(f"note over {from_id},{to_id}: {note}")
                 if response:
-                    lines.append(f"{to_id}-->>{from_id}: {response}")
-                lines.append("")
+                    append(f"{to_id}-->>{from_id}: {response}")
+                append("")
 
         elif endpoints:
             # Add actors and participants
-            lines.append("actor User")
-            lines.append("")
+            append("actor User")
+            append("")
             
-            # Extract unique controllers/classes
-            participants = set()
-            for endpoint in endpoints:
-                class_name = endpoint.get('class', endpoint.get('controller', 'Controller'))
-                participants.add(class_name)
+            # Extract unique controllers/classes, resolving each endpoint's owner once
+            owners = [endpoint.get('class', endpoint.get('controller', 'Controller')) for endpoint in endpoints]
             
-            for participant in sorted(participants):
-                lines.append(f"participant {participant}")
+            lines.extend(f"participant {participant}" for participant in sorted(set(owners)))
             
-            lines.append("")
+            append("")
             
             # Add interactions
-            for endpoint in endpoints[:20]:  # Limit to first 20 to avoid clutter
+            for endpoint, class_name in zip(endpoints[:20], owners):  # Limit to first 20 to avoid clutter
                 method = endpoint.get('method', 'GET')
                 path = endpoint.get('path', '/')
-                class_name = endpoint.get('class', endpoint.get('controller', 'Controller'))
                 
-                lines.append(f"User -> {class_name}: {method} {path}")
-                lines.append(f"activate {class_name}")
-                lines.append(f"{class_name} --> User: Response")
-                lines.append(f"deactivate {class_name}")
-                lines.append("")
+                append(f"User -> {class_name}: {method} {path}")
+                append(f"activate {class_name}")
+                append(f"{class_name} --> User: Response")
+                append(f"deactivate {class_name}")
+                append("")
         else:
-            lines.append("actor User")
-            lines.append("participant System")
-            lines.append("User -> System: Request")
-            lines.append("System --> User: Response")
-            lines.append("")
-        lines.append("@enduml")
+            return self._enforce_line_limit(self._emit_fallback('sequence'))
+        append("@enduml")
         plantuml = "\n".join(lines)
         return self._enforce_line_limit(plantuml)
 
@@ -395,70 +581,68 @@ class PlantUMLGenerator:
         logger.info("Building PlantUML use case diagram")
         
         lines = [
-            "@startuml",
-            f"!theme {self.theme}",
+            *self._header,
             "left to right direction",
             "' Use Case Diagram",
             ""
         ]
+        append = lines.append
         
-        usecases = schema.get('usecases', []) or []
-        endpoints = schema.get('endpoints', []) or []
+        usecases = schema.get('usecases') or ()
+        endpoints = schema.get('endpoints') or ()
+        meta = schema.get('meta')
+        system_name = (meta.get('system') if isinstance(meta, dict) else None) or 'System'
 
         if usecases:
             actors: Dict[str, str] = {}
             usecase_nodes: Dict[str, str] = {}
 
             def sanitize(name: str, prefix: str = 'UC') -> str:
-                base = ''.join(ch if ch.isalnum() else '_' for ch in (name or 'UseCase')) or prefix
-                return f"{prefix}_{base}"
+                return f"{prefix}_{_ident(name or 'UseCase') or prefix}"
 
             for usecase in usecases[:30]:
                 primary_actor = usecase.get('actor') or 'User'
                 actors.setdefault(primary_actor, sanitize(primary_actor, 'ACT'))
-                for supporting in usecase.get('supportingActors', []) or []:
+                for supporting in usecase.get('supportingActors') or ():
                     actors.setdefault(supporting, sanitize(supporting, 'ACT'))
 
                 label = usecase.get('name') or usecase.get('action') or usecase.get('goal') or 'Use Case'
                 usecase_nodes.setdefault(label, sanitize(label))
 
-            for actor_name, identifier in actors.items():
-                lines.append(f"actor {identifier} as \"{actor_name}\"")
+            # Register include/extend targets up front so every node is declared inside the rectangle
+            for usecase in usecases[:30]:
+                for target in chain(usecase.get('includes') or (), usecase.get('extends') or ()):
+                    if target not in usecase_nodes:
+                        usecase_nodes[target] = sanitize(target)
 
-            lines.append("")
-            system_name = schema.get('meta', {}).get('system') or 'System'
-            lines.append(f"rectangle \"{system_name}\" {{")
+            lines.extend(f"actor {identifier} as \"{actor_name}\"" for actor_name, identifier in actors.items())
+
+            append("")
+            append(f"rectangle \"{system_name}\" {{")
 
-            for label, identifier in usecase_nodes.items():
-                lines.append(f"  usecase {identifier} as \"{label}\"")
+            lines.extend(f"  usecase {identifier} as \"{label}\"" for label, identifier in usecase_nodes.items())
 
-            lines.append("}")
+            append("}")
 
             for usecase in usecases[:30]:
                 label = usecase.get('name') or usecase.get('action') or usecase.get('goal') or 'Use Case'
                 identifier = usecase_nodes[label]
                 primary_actor = usecase.get('actor') or 'User'
                 if primary_actor in actors:
-                    lines.append(f"{actors[primary_actor]} --> {identifier}")
-                for supporting in usecase.get('supportingActors', []) or []:
+                    append(f"{actors[primary_actor]} --> {identifier}")
+                for supporting in usecase.get('supportingActors') or ():
                     if supporting in actors:
-                        lines.append(f"{actors[supporting]} --> {identifier}")
+                        append(f"{actors[supporting]} --> {identifier}")
 
-                for include in usecase.get('includes', []) or []:
-                    if include not in usecase_nodes:
-                        usecase_nodes[include] = sanitize(include)
-                        lines.insert(-1, f"  usecase {usecase_nodes[include]} as \"{include}\"")
-                    lines.append(f"{identifier} ..> {usecase_nodes[include]} : <<include>>")
+                for include in usecase.get('includes') or ():
+                    append(f"{identifier} ..> {usecase_nodes[include]} : <<include>>")
 
-                for extends in usecase.get('extends', []) or []:
-                    if extends not in usecase_nodes:
-                        usecase_nodes[extends] = sanitize(extends)
-                        lines.insert(-1, f"  usecase {usecase_nodes[extends]} as \"{extends}\"")
-                    lines.append(f"{identifier} ..> {usecase_nodes[extends]} : <<extends>>")
+                for extends in usecase.get('extends') or ():
+                    append(f"{identifier} ..> {usecase_nodes[extends]} : <<extends>>")
 
         elif endpoints:
-            lines.append("actor User")
-            lines.append("")
+            append("actor User")
+            append("")
             unique_actions = []
             seen = set()
             for endpoint in endpoints[:20]:
@@ -469,26 +653,25 @@ class PlantUMLGenerator:
                     seen.add(action)
                     unique_actions.append(action)
             for action in unique_actions:
-                lines.append(f"({action})")
-                lines.append(f"User --> ({action})")
+                append(f"({action})")
+                append(f"User --> ({action})")
         else:
             derived_usecases = self._derive_use_cases(schema, limit=8)
             if derived_usecases:
-                lines.append("actor User")
-                lines.append("")
-                system_name = schema.get('meta', {}).get('system') or 'System'
-                lines.append(f"rectangle \"{system_name}\" {{")
+                append("actor User")
+                append("")
+                append(f"rectangle \"{system_name}\" {{")
                 for idx, uc in enumerate(derived_usecases):
                     identifier = f"UC_{idx}"
-                    lines.append(f"  usecase {identifier} as \"{uc['label']}\"")
-                    lines.append(f"  User --> {identifier}")
-                lines.append("}")
+                    append(f"  usecase {identifier} as \"{uc['label']}\"")
+                    append(f"  User --> {identifier}")
+                append("}")
             else:
-                lines.append("actor User")
-                lines.append("(Use System)")
-                lines.append("User --> (Use System)")
+                append("actor User")
+                append("(Use System)")
+                append("User --> (Use System)")
         
-        lines.append("@enduml")
+        append("@enduml")
         return "\n".join(lines)
     
     def build_state_diagram(self, schema: Dict[str, Any]) -> str:
@@ -504,26 +687,26 @@ class PlantUMLGenerator:
         logger.info("Building PlantUML state diagram")
         
         lines = [
-            "@startuml",
-            f"!theme {self.theme}",
+            *self._header,
             "' State Machine Diagram",
             "",
             "[*] --> Initial"
         ]
+        append = lines.append
         
         states_data = schema.get('states', [])
         if isinstance(states_data, list) and states_data:
             for state_block in states_data[:10]:
-                if not isinstance(state_block, dict):
+                if type(state_block) is not dict:
                     continue
                 context = state_block.get('context') or state_block.get('class') or 'Component'
-                context_id = ''.join(ch if ch.isalnum() else '_' for ch in context) or 'Stateful'
-                lines.append(f"state \"{context}\" as {context_id} {{")
+                context_id = _ident(context) or 'Stateful'
+                append(f"state \"{context}\" as {context_id} {{")
 
                 states = state_block.get('states') or state_block.get('state_fields') or []
                 if isinstance(states, list) and states:
                     first_state = states[0] if isinstance(states[0], str) else states[0].get('name', 'State')
-                    lines.append(f"  [*] --> {''.join(ch if ch.isalnum() else '_' for ch in str(first_state))}")
+                    append(f"  [*] --> {_ident(str(first_state))}")
                     for state in states:
                         if isinstance(state, str):
                             state_name = state
@@ -531,57 +714,45 @@ class PlantUMLGenerator:
                         else:
                             state_name = state.get('name', 'State')
                             label = state.get('label', state_name)
-                        identifier = ''.join(ch if ch.isalnum() else '_' for ch in str(state_name)) or 'State'
-                        lines.append(f"  state {identifier} : {label}")
+                        identifier = _ident(str(state_name)) or 'State'
+                        append(f"  state {identifier} : {label}")
 
                 transitions = state_block.get('transitions') or []
                 if isinstance(transitions, list):
                     for transition in transitions:
-                        if not isinstance(transition, dict):
+                        if type(transition) is not dict:
                             continue
                         from_state = transition.get('from', 'State')
                         to_state = transition.get('to', 'State')
                         trigger = transition.get('trigger') or transition.get('event')
-                        from_id = ''.join(ch if ch.isalnum() else '_' for ch in str(from_state))
-                        to_id = ''.join(ch if ch.isalnum() else '_' for ch in str(to_state))
+                        from_id = _ident(str(from_state))
+                        to_id = _ident(str(to_state))
                         if trigger:
-                            lines.append(f"  {from_id} --> {to_id} : {trigger}")
+                            append(f"  {from_id} --> {to_id} : {trigger}")
                         else:
-                            lines.append(f"  {from_id} --> {to_id}")
+                            append(f"  {from_id} --> {to_id}")
 
-                lines.append("}")
+                append("}")
         else:
-            classes = self._collect_classes(schema)
-            stateful = self._stateful_classes(classes)
+            classes, stateful = self._collect_classes_with_stateful(schema)
             if stateful:
                 for cls in stateful[:4]:
                     class_name = cls.get('class', 'Component')
-                    identifier = ''.join(ch if ch.isalnum() else '_' for ch in class_name) or 'Component'
-                    lines.append(f"state \"{class_name}\" as {identifier} {{")
-                    lines.append("  [*] --> Initialized")
-                    lines.append("  Initialized --> Active : setState()")
-                    lines.append("  Active --> Suspended : pause()")
-                    lines.append("  Suspended --> Active : resume()")
-                    lines.append("  Active --> Completed : complete()")
-                    lines.append("  Completed --> [*]")
-                    lines.append("}")
+                    identifier = _ident(class_name) or 'Component'
+                    append(f"state \"{class_name}\" as {identifier} {{")
+                    lines.extend(_STATEFUL_LIFECYCLE)
             elif classes:
                 for cls in classes[:4]:
                     class_name = cls.get('class', 'Component')
-                    identifier = ''.join(ch if ch.isalnum() else '_' for ch in class_name) or 'Component'
-                    lines.append(f"state \"{class_name}\" as {identifier} {{")
-                    lines.append("  [*] --> Created")
-                    lines.append("  Created --> Active : initialize()")
-                    lines.append("  Active --> Completed : finalize()")
-                    lines.append("  Completed --> Archived : archive()")
-                    lines.append("  Archived --> [*]")
-                    lines.append("}")
+                    identifier = _ident(class_name) or 'Component'
+                    append(f"state \"{class_name}\" as {identifier} {{")
+                    lines.extend(_DEFAULT_LIFECYCLE)
             else:
-                lines.append("Initial --> Processing")
-                lines.append("Processing --> Complete")
-                lines.append("Complete --> [*]")
+                append("Initial --> Processing")
+                append("Processing --> Complete")
+                append("Complete --> [*]")
         
-        lines.append("@enduml")
+        append("@enduml")
         return "\n".join(lines)
     
     def build_activity_diagram(self, schema: Dict[str, Any]) -> str:
@@ -597,31 +768,34 @@ class PlantUMLGenerator:
         logger.info("Building PlantUML activity diagram")
         
         lines = [
-            "@startuml",
-            f"!theme {self.theme}",
+            *self._header,
             "' Activity Diagram",
             "",
             "start"
         ]
         
-        activity_items: List[Dict[str, Any]] = []
-        if isinstance(schema.get('activity'), list):
-            activity_items.extend([item for item in schema.get('activity') if isinstance(item, dict)])
-        if isinstance(schema.get('activity_flows'), list):
-            activity_items.extend([item for item in schema.get('activity_flows') if isinstance(item, dict)])
+        activity_items: List[Dict[str, Any]] = [
+            item
+            for source in (schema.get('activity'), schema.get('activity_flows'))
+            if type(source) is list
+            for item in source
+            if type(item) is dict
+        ]
 
         if activity_items:
             seen_steps = set()
             for activity in activity_items[:30]:
                 step = activity.get('step') or activity.get('name') or 'Activity'
-                role = activity.get('role')
-                class_name = activity.get('class')
-                label = step
-                if role:
-                    label += f"\\n({role})"
-                if class_name:
-                    label += f"\\nin {class_name}"
                 if step not in seen_steps:
+                    # The label is only rendered for a step's first occurrence
+                    parts = [step]
+                    role = activity.get('role')
+                    if role:
+                        parts.append(f"({role})")
+                    class_name = activity.get('class')
+                    if class_name:
+                        parts.append(f"in {class_name}")
+                    label = "\\n".join(parts) if len(parts) > 1 else step
                     lines.append(f":{label};")
                     seen_steps.add(step)
 
@@ -659,13 +833,12 @@ class PlantUMLGenerator:
         logger.info("Building PlantUML communication diagram")
         
         lines = [
-            "@startuml",
-            f"!theme {self.theme}",
+            *self._header,
             "' Communication Diagram",
             ""
         ]
         
-        relations = schema.get('relations', []) or []
+        relations = schema.get('relations') or ()
         classes = self._collect_classes(schema)
         
         if relations:
@@ -678,7 +851,7 @@ class PlantUMLGenerator:
                     participants.add(relation.get('to'))
             
             # Limit to top participants by relationship count
-            top_participants = list(participants)[:8]
+            top_participants = list(islice(participants, 8))
             
             # Declare participants
             for participant in top_participants:
@@ -717,14 +890,7 @@ class PlantUMLGenerator:
         
         else:
             # Generic fallback (distinct from class diagram)
-            lines.append("participant Client")
-            lines.append("participant API")
-            lines.append("participant Database")
-            lines.append("")
-            lines.append("Client -> API : 1. call endpoint")
-            lines.append("API -> Database : 2. query")
-            lines.append("Database --> API : 3. result")
-            lines.append("API --> Client : 4. response")
+            return self._emit_fallback('communication')
         
         lines.append("@enduml")
         return "\n".join(lines)
@@ -742,76 +908,53 @@ class PlantUMLGenerator:
         logger.info("Building PlantUML component diagram")
         
         lines = [
-            "@startuml",
-            f"!theme {self.theme}",
+            *self._header,
             "' Component Diagram",
             ""
         ]
         
         classes = self._collect_classes(schema)
-        relations = schema.get('relations', []) or []
-        endpoints = schema.get('endpoints', []) or []
+        relations = schema.get('relations') or ()
+        endpoints = schema.get('endpoints') or ()
         
         if classes:
             # Group classes by package/namespace
-            packages = {}
+            packages: Dict[str, List[Dict[str, Any]]] = {}
             for cls in classes:
-                package_name = cls.get('package') or cls.get('namespace') or 'Default'
-                if package_name not in packages:
-                    packages[package_name] = []
-                packages[package_name].append(cls)
+                packages.setdefault(cls.get('package') or cls.get('namespace') or 'Default', []).append(cls)
             
             # Create components for packages
             for package_name, package_classes in packages.items():
                 if len(package_classes) > 1:
                     lines.append(f"package \"{package_name}\" {{")
-                    for cls in package_classes[:5]:  # Limit classes per package
-                        component_name = cls.get('class', 'Component')
-                        lines.append(f"  component {component_name}")
+                    # Limit classes per package
+                    lines.extend(f"  component {cls.get('class', 'Component')}" for cls in package_classes[:5])
                     lines.append("}")
                 else:
-                    for cls in package_classes:
-                        component_name = cls.get('class', 'Component')
-                        lines.append(f"component {component_name}")
+                    lines.extend(f"component {cls.get('class', 'Component')}" for cls in package_classes)
             
             lines.append("")
             
             # Add relationships between components
-            for relation in relations[:10]:
-                frm = relation.get('from')
-                to = relation.get('to')
-                if frm and to:
-                    relation_type = relation.get('type', 'uses')
-                    lines.append(f"{frm} --> {to} : {relation_type}")
+            lines.extend(
+                f"{relation['from']} --> {relation['to']} : {relation.get('type', 'uses')}"
+                for relation in relations[:10]
+                if relation.get('from') and relation.get('to')
+            )
         
         elif endpoints:
             # Create components based on endpoints
-            controllers = set()
-            for endpoint in endpoints:
-                controller = endpoint.get('controller') or endpoint.get('class') or 'API'
-                controllers.add(controller)
+            controllers = {endpoint.get('controller') or endpoint.get('class') or 'API' for endpoint in endpoints}
             
-            for controller in controllers:
-                lines.append(f"component {controller}")
-            
-            lines.append("")
-            lines.append("component Database")
-            lines.append("")
+            lines.extend(f"component {controller}" for controller in controllers)
+            lines.extend(("", "component Database", ""))
             
             # Connect controllers to database
-            for controller in list(controllers)[:3]:
-                lines.append(f"{controller} --> Database : queries")
+            lines.extend(f"{controller} --> Database : queries" for controller in islice(controllers, 3))
         
         else:
             # Generic fallback (distinct from class diagram)
-            lines.append("component Frontend")
-            lines.append("component API")
-            lines.append("component AuthService")
-            lines.append("component Database")
-            lines.append("")
-            lines.append("Frontend --> API : HTTP")
-            lines.append("API --> AuthService : Auth")
-            lines.append("API --> Database : queries")
+            return self._emit_fallback('component')
         
         lines.append("@enduml")
         return "\n".join(lines)
@@ -829,68 +972,31 @@ class PlantUMLGenerator:
         logger.info("Building PlantUML deployment diagram")
         
         lines = [
-            "@startuml",
-            f"!theme {self.theme}",
+            *self._header,
             "' Deployment Diagram",
             ""
         ]
         
         classes = self._collect_classes(schema)
-        endpoints = schema.get('endpoints', []) or []
+        endpoints = schema.get('endpoints') or ()
         
         if endpoints:
             # Create nodes based on endpoints
-            lines.append("node \"Web Server\" {")
-            lines.append("  component API")
-            lines.append("}")
-            lines.append("")
-            lines.append("node \"Database Server\" {")
-            lines.append("  database Database")
-            lines.append("}")
-            lines.append("")
-            lines.append("API --> Database : queries")
+            lines.extend(_DEPLOYMENT_ENDPOINT_NODES)
         
         elif classes:
             # Create deployment based on classes
+            component_names = [cls.get('class', 'Component') for cls in classes[:3]]
             lines.append("node \"Application Server\" {")
-            for cls in classes[:3]:
-                component_name = cls.get('class', 'Component')
-                lines.append(f"  component {component_name}")
-            lines.append("}")
-            lines.append("")
-            lines.append("node \"Database Server\" {")
-            lines.append("  database Database")
-            lines.append("}")
-            lines.append("")
+            lines.extend(f"  component {name}" for name in component_names)
+            lines.extend(("}", "", "node \"Database Server\" {", "  database Database", "}", ""))
             
             # Connect components
-            for i, cls in enumerate(classes[:3]):
-                component_name = cls.get('class', 'Component')
-                lines.append(f"{component_name} --> Database : data access")
+            lines.extend(f"{name} --> Database : data access" for name in component_names)
         
         else:
             # Generic fallback (distinct from class diagram)
-            lines.append("node \"Client Machine\" {")
-            lines.append("  artifact App")
-            lines.append("}")
-            lines.append("")
-            lines.append("node \"Web Server\" {")
-            lines.append("  component Frontend")
-            lines.append("}")
-            lines.append("")
-            lines.append("node \"API Server\" {")
-            lines.append("  component API")
-            lines.append("  component AuthService")
-            lines.append("}")
-            lines.append("")
-            lines.append("node \"Database Server\" {")
-            lines.append("  database Database")
-            lines.append("}")
-            lines.append("")
-            lines.append("App --> Frontend : HTTP")
-            lines.append("Frontend --> API : REST")
-            lines.append("API --> AuthService : Auth")
-            lines.append("API --> Database : queries")
+            return self._emit_fallback('deployment')
         
         lines.append("@enduml")
         return "\n".join(lines)
@@ -912,16 +1018,13 @@ class PlantUMLGenerator:
             return False, "Schema must be a dictionary"
         
         # Check for at least one supported language or data
-        languages = ['python', 'java', 'csharp', 'javascript', 'typescript', 'cpp', 'c']
-        has_classes = any(
-            isinstance(schema.get(lang), list) and len(schema.get(lang, [])) > 0
-            for lang in languages
-        )
-        
-        has_relations = isinstance(schema.get('relations'), list) and len(schema.get('relations', [])) > 0
-        has_endpoints = isinstance(schema.get('endpoints'), list) and len(schema.get('endpoints', [])) > 0
-        
-        if not (has_classes or has_relations or has_endpoints):
+        relations = schema.get('relations')
+        endpoints = schema.get('endpoints')
+        if not (
+            _has_language_classes(schema)
+            or isinstance(relations, list) and relations
+            or isinstance(endpoints, list) and endpoints
+        ):
             return False, "Schema must contain at least classes, relations, or endpoints"
         
         return True, None
@@ -952,8 +1055,8 @@ class PlantUMLGenerator:
             'languages': []
         }
         
-        for lang in ['python', 'java', 'csharp', 'javascript', 'typescript', 'cpp', 'c']:
-            classes = schema.get(lang, [])
+        for lang in _LANGUAGE_KEYS:
+            classes = schema.get(lang)
             if classes:
                 stats['total_classes'] += len(classes)
                 stats['languages'].append(lang)
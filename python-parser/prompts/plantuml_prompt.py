@@ -5,12 +5,15 @@
 from __future__ import annotations
 
 import json
+import sys
+from functools import lru_cache
 from textwrap import dedent
-from typing import Any, Dict, Optional, Sequence
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
 
 SUPPORTED_FORMATS = {"plantuml"}
 
-_DIAGRAM_GUIDANCE = {
+_DIAGRAM_GUIDANCE: Mapping[str, Sequence[str]] = MappingProxyType({
     "class": (
         "Model the core domain types, their attributes, and key operations.",
         "Use inheritance (extends), interfaces (implements), composition (--*), and aggregation (--o) to express relationships accurately.",
@@ -72,10 +75,13 @@ _DIAGRAM_GUIDANCE = {
         "Group artifacts within nodes using curly braces.",
         "Label connections with protocols or network types if relevant.",
     ),
-}
+})
+
+# Supported diagram types for PlantUML
+PLANTUML_DIAGRAM_TYPES = frozenset(_DIAGRAM_GUIDANCE)
 
 # Forbidden lists for PlantUML diagram types
-_PLANTUML_FORBIDDEN = {
+_PLANTUML_FORBIDDEN: Mapping[str, Sequence[str]] = MappingProxyType({
     "communication": (
     "",
         "Use ONLY PlantUML communication diagram syntax: participant, ->, alt, opt, loop, etc.",
@@ -91,37 +97,92 @@ _PLANTUML_FORBIDDEN = {
         "Use ONLY PlantUML deployment diagram syntax: node, artifact, database, cloud, etc.",
         "Do not use classDiagram, sequenceDiagram, or component keywords.",
     ),
-}
+})
+
+
+# Pre-rendered, per-diagram-type prompt sections (they depend on nothing else); all of
+# these tables are read-only views so a caller cannot alter later prompts by mutating them
+_GUIDANCE_BLOCKS: Mapping[str, str] = MappingProxyType({
+    key: "\n".join(f"- {line.strip()}" for line in lines)
+    for key, lines in _DIAGRAM_GUIDANCE.items()
+})
+
+# Strict, type-specific rules and minimal valid examples
+_STRICT_EXAMPLES: Mapping[str, str] = MappingProxyType({
+    "class": """\nSTRICT RULES:\n- Only use PlantUML class diagram syntax.\n- Do not use state, activity, deployment, or component diagram syntax.\n- Minimal valid example:\n@startuml\nclass User {\n  +id: int\n  +name: string\n}\n@enduml\n""",
+    "state": """\nSTRICT RULES:\n- Only use PlantUML state diagram syntax.\n- Do not use @startuml as a state name.\n- Always start with [*] and have at least one valid state and transition.\n- Minimal valid example:\n@startuml\n[*] --> Idle\nIdle --> Processing : start\nProcessing --> [*] : finish\n@enduml\n""",
+    "activity": """\nSTRICT RULES:\n- Only use PlantUML activity diagram syntax.\n- Do not use class, state, deployment, or component diagram syntax.\n- Always start with 'start' and end with 'stop'.\n- Minimal valid example:\n@startuml\nstart\n:Do something;\nstop\n@enduml\n""",
+    "deployment": """\nSTRICT RULES:\n- Only use PlantUML deployment diagram syntax.\n- Do not use class, state, activity, or component diagram syntax.\n- Always declare at least one node and one relationship.\n- Minimal valid example:\n@startuml\nnode WebServer\nnode Database\nWebServer --> Database : connects\n@enduml\n""",
+    "component": """\nSTRICT RULES:\n- Only use PlantUML component diagram syntax.\n- Do not use class, state, activity, or deployment diagram syntax.\n- Minimal valid example:\n@startuml\ncomponent API\ncomponent DB\nAPI --> DB : queries\n@enduml\n""",
+})
+
+# Diagram-specific examples, only emitted for PlantUML output
+_EXAMPLES_SECTIONS: Mapping[str, str] = MappingProxyType({
+    "usecase": dedent("""
+        EXAMPLE USE CASE SYNTAX:
+        @startuml
+        actor User
+        rectangle System {
+            usecase "Browse Products" as UC1
+            usecase "Place Order" as UC2
+        }
+        User --> UC1
+        User --> UC2
+        @enduml
+        """).strip(),
+    "state": dedent("""
+        EXAMPLE STATE SYNTAX:
+        @startuml
+        [*] --> Draft
+        state "Pending Payment" as Pending
+        Draft --> Pending : submit
+        Pending --> [*] : complete
+        @enduml
+        """).strip(),
+    "activity": dedent("""
+        EXAMPLE ACTIVITY SYNTAX:
+        @startuml
+        start
+        :User enters prompt;
+        if (valid?) then (yes)
+          :Generate diagram;
+        else (no)
+          :Show error;
+        endif
+        stop
+        @enduml
+        """).strip(),
+})
+
+
+def _strict_rules(diagram_key: str) -> str:
+    """Stricter forbidden syntax and explicit rules for problematic types."""
+    if diagram_key not in ("state", "activity", "component", "deployment"):
+        return ""
+    forbidden = _PLANTUML_FORBIDDEN.get(diagram_key, [])
+    forbidden_section = "\n".join(f"- {line}" for line in forbidden)
+    # Add explicit rules for simplicity and no nesting
+    if diagram_key in ("state", "activity"):
+        extra = """
+- NEVER use nested blocks or curly braces.
+- NEVER use more than 8 lines in the diagram (excluding @startuml/@enduml).
+- NEVER use swimlanes (|PartitionName|) or any syntax except direct transitions/actions.
+- ONLY use direct transitions (-->), actions (:) and start/stop for activity.
+- NEVER use state blocks or nested states for state diagrams.
+"""
+    elif diagram_key in ("component", "deployment"):
+        extra = """
+- NEVER use nested packages, nodes, or curly braces.
+- NEVER use more than 8 lines in the diagram (excluding @startuml/@enduml).
+- ONLY use direct component/node/interface/artifact/database/cloud declarations and direct relationships (arrows).
+- NEVER use any block or grouping syntax.
+"""
+    else:
+        extra = ""
+    return f"\nSTRICT RULES\n------------\n{forbidden_section}\n{extra.strip()}\n"
 
-# Supported diagram types for PlantUML
-PLANTUML_DIAGRAM_TYPES = {
-    "class",
-    "sequence",
-    "usecase",
-    "activity",
-    "state",
-    "communication",
-    "component",
-    "deployment",
-}
-
-_PLANTUML_FORBIDDEN: Dict[str, Sequence[str]] = {
-    "communication": (
-    "",
-        "Use ONLY PlantUML communication diagram syntax: participant, ->, alt, opt, loop, etc.",
-        "Do not use classDiagram, component, or deployment keywords.",
-    ),
-    "component": (
-    "",
-        "Use ONLY PlantUML component diagram syntax: [Component], component, interface, etc.",
-        "Do not use classDiagram, sequenceDiagram, or deployment keywords.",
-    ),
-    "deployment": (
-    "",
-        "Use ONLY PlantUML deployment diagram syntax: node, artifact, database, cloud, etc.",
-        "Do not use classDiagram, sequenceDiagram, or component keywords.",
-    ),
-}
+
+_STRICT_RULES: Mapping[str, str] = MappingProxyType({key: _strict_rules(key) for key in _DIAGRAM_GUIDANCE})
 
 
 def _format_context(context: Optional[Dict[str, Any]]) -> str:
@@ -151,74 +212,19 @@ def _format_context(context: Optional[Dict[str, Any]]) -> str:
     return "\n".join(formatted_sections) if formatted_sections else "None"
 
 
-def build_plantuml_prompt(
-    user_prompt: str,
-    *,
-    diagram_type: str = "class",
-    output_format: str = "plantuml",
-    context: Optional[Dict[str, Any]] = None,
-    schema: Optional[Dict[str, Any]] = None,
-    style_preferences: Optional[Dict[str, Any]] = None,
-    focus: Optional[Sequence[str]] = None,
+# Retries and diagram-type toggles resend the same request; the rendered sections form the key
+@lru_cache(maxsize=256)
+def _render_prompt(
+    user_goal: str,
+    diagram_key: str,
+    fmt: str,
+    context_section: str,
+    schema_section: str,
+    style_section: str,
+    focus_section: str,
 ) -> str:
-    """Construct a rich prompt for an LLM to emit diagram code.
-
-    Args:
-        user_prompt: Raw natural-language instructions from the user.
-        diagram_type: Desired UML diagram variant (class, sequence, usecase, state, activity).
-    output_format: Target syntax. Supports "plantuml" (default).
-        context: Optional supplemental context (e.g., existing schema, architecture notes).
-        style_preferences: Optional hints for visual style or layout.
-        focus: Optional list of emphasis areas (e.g., ["security", "scalability"]).
-
-    Returns:
-        A single formatted prompt string ready to send to the LLM.
-    """
-    if not isinstance(user_prompt, str) or not user_prompt.strip():
-        raise ValueError("user_prompt must be a non-empty string")
-
-    diagram_key = diagram_type.lower().strip()
-    if diagram_key not in _DIAGRAM_GUIDANCE:
-        valid = ", ".join(sorted(_DIAGRAM_GUIDANCE))
-        raise ValueError(f"Unsupported diagram_type '{diagram_type}'. Valid options: {valid}")
-
-    fmt = output_format.lower().strip()
-    if fmt not in SUPPORTED_FORMATS:
-        valid_formats = ", ".join(sorted(SUPPORTED_FORMATS))
-        raise ValueError(f"Unsupported output_format '{output_format}'. Valid options: {valid_formats}")
-
-    guidance_lines = "\n".join(f"- {line.strip()}" for line in _DIAGRAM_GUIDANCE[diagram_key])
-
-    # Add strict, type-specific rules and minimal valid examples
-    strict_examples = {
-        "class": """\nSTRICT RULES:\n- Only use PlantUML class diagram syntax.\n- Do not use state, activity, deployment, or component diagram syntax.\n- Minimal valid example:\n@startuml\nclass User {\n  +id: int\n  +name: string\n}\n@enduml\n""",
-        "state": """\nSTRICT RULES:\n- Only use PlantUML state diagram syntax.\n- Do not use @startuml as a state name.\n- Always start with [*] and have at least one valid state and transition.\n- Minimal valid example:\n@startuml\n[*] --> Idle\nIdle --> Processing : start\nProcessing --> [*] : finish\n@enduml\n""",
-        "activity": """\nSTRICT RULES:\n- Only use PlantUML activity diagram syntax.\n- Do not use class, state, deployment, or component diagram syntax.\n- Always start with 'start' and end with 'stop'.\n- Minimal valid example:\n@startuml\nstart\n:Do something;\nstop\n@enduml\n""",
-        "deployment": """\nSTRICT RULES:\n- Only use PlantUML deployment diagram syntax.\n- Do not use class, state, activity, or component diagram syntax.\n- Always declare at least one node and one relationship.\n- Minimal valid example:\n@startuml\nnode WebServer\nnode Database\nWebServer --> Database : connects\n@enduml\n""",
-        "component": """\nSTRICT RULES:\n- Only use PlantUML component diagram syntax.\n- Do not use class, state, activity, or deployment diagram syntax.\n- Minimal valid example:\n@startuml\ncomponent API\ncomponent DB\nAPI --> DB : queries\n@enduml\n""",
-    }
-    strict_section = strict_examples.get(diagram_key, "")
-    context_section = _format_context(context)
-
-    schema_section = "None"
-    if schema:
-        try:
-            schema_section = json.dumps(schema, indent=2, ensure_ascii=False)
-        except TypeError:
-            schema_section = str(schema)
-
-    style_section = "None"
-    if style_preferences:
-        try:
-            style_section = json.dumps(style_preferences, indent=2, ensure_ascii=False)
-        except TypeError:
-            style_section = str(style_preferences)
-
-    focus_section = "None"
-    if focus:
-        cleaned = [item.strip() for item in focus if str(item).strip()]
-        if cleaned:
-            focus_section = "\n".join(f"- {item}" for item in cleaned)
+    guidance_lines = _GUIDANCE_BLOCKS[diagram_key]
+    strict_section = _STRICT_EXAMPLES.get(diagram_key, "")
 
     syntax_directive = (
         "Return PlantUML code starting with '@startuml' and ending with '@enduml'."
@@ -226,72 +232,8 @@ def build_plantuml_prompt(
     else "Return raw PlantUML syntax without wrapping it in markdown fences."
     )
 
-    # Add diagram-specific examples for PlantUML
-    examples_section = ""
-    if fmt == "plantuml":
-        examples_map = {
-            "usecase": dedent("""
-                EXAMPLE USE CASE SYNTAX:
-                @startuml
-                actor User
-                rectangle System {
-                    usecase "Browse Products" as UC1
-                    usecase "Place Order" as UC2
-                }
-                User --> UC1
-                User --> UC2
-                @enduml
-                """).strip(),
-            "state": dedent("""
-                EXAMPLE STATE SYNTAX:
-                @startuml
-                [*] --> Draft
-                state "Pending Payment" as Pending
-                Draft --> Pending : submit
-                Pending --> [*] : complete
-                @enduml
-                """).strip(),
-            "activity": dedent("""
-                EXAMPLE ACTIVITY SYNTAX:
-                @startuml
-                start
-                :User enters prompt;
-                if (valid?) then (yes)
-                  :Generate diagram;
-                else (no)
-                  :Show error;
-                endif
-                stop
-                @enduml
-                """).strip(),
-        }
-        examples_section = examples_map.get(diagram_key, "")
-
-
-    # Inject stricter forbidden syntax and explicit rules for problematic types
-    strict_rules = ""
-    if diagram_key in ("state", "activity", "component", "deployment"):
-        forbidden = _PLANTUML_FORBIDDEN.get(diagram_key, [])
-        forbidden_section = "\n".join(f"- {line}" for line in forbidden)
-        # Add explicit rules for simplicity and no nesting
-        if diagram_key in ("state", "activity"):
-            extra = """
-- NEVER use nested blocks or curly braces.
-- NEVER use more than 8 lines in the diagram (excluding @startuml/@enduml).
-- NEVER use swimlanes (|PartitionName|) or any syntax except direct transitions/actions.
-- ONLY use direct transitions (-->), actions (:) and start/stop for activity.
-- NEVER use state blocks or nested states for state diagrams.
-"""
-        elif diagram_key in ("component", "deployment"):
-            extra = """
-- NEVER use nested packages, nodes, or curly braces.
-- NEVER use more than 8 lines in the diagram (excluding @startuml/@enduml).
-- ONLY use direct component/node/interface/artifact/database/cloud declarations and direct relationships (arrows).
-- NEVER use any block or grouping syntax.
-"""
-        else:
-            extra = ""
-        strict_rules = f"\nSTRICT RULES\n------------\n{forbidden_section}\n{extra.strip()}\n"
+    examples_section = _EXAMPLES_SECTIONS.get(diagram_key, "") if fmt == "plantuml" else ""
+    strict_rules = _STRICT_RULES[diagram_key]
 
     prompt = dedent(
         f"""
@@ -300,7 +242,7 @@ def build_plantuml_prompt(
 
         USER GOAL
         ---------
-        {user_prompt.strip()}
+        {user_goal}
 
         OUTPUT REQUIREMENTS
         --------------------
@@ -349,4 +291,97 @@ def build_plantuml_prompt(
     return prompt
 
 
+def _split_minimal_prompt(diagram_key: str, fmt: str) -> Tuple[str, str]:
+    # Render with a one-line placeholder goal: a goal without newlines cannot change the
+    # margin textwrap.dedent removes, so any such goal can be spliced in between the halves.
+    prefix, _, suffix = _render_prompt.__wrapped__(
+        "\x00", diagram_key, fmt, "None", "None", "None", "None"
+    ).partition("\x00")
+    return prefix, suffix
+
+
+# Prompts for calls without context, schema, style or focus, split around the user goal
+_MINIMAL_PROMPTS: Mapping[Tuple[str, str], Tuple[str, str]] = MappingProxyType({
+    (diagram_key, fmt): _split_minimal_prompt(diagram_key, fmt)
+    for diagram_key in _DIAGRAM_GUIDANCE
+    for fmt in SUPPORTED_FORMATS
+})
+
+
+def build_plantuml_prompt(
+    user_prompt: str,
+    *,
+    diagram_type: str = "class",
+    output_format: str = "plantuml",
+    context: Optional[Dict[str, Any]] = None,
+    schema: Optional[Dict[str, Any]] = None,
+    style_preferences: Optional[Dict[str, Any]] = None,
+    focus: Optional[Sequence[str]] = None,
+) -> str:
+    """Construct a rich prompt for an LLM to emit diagram code.
+
+    Args:
+        user_prompt: Raw natural-language instructions from the user.
+        diagram_type: Desired UML diagram variant (class, sequence, usecase, state, activity).
+    output_format: Target syntax. Supports "plantuml" (default).
+        context: Optional supplemental context (e.g., existing schema, architecture notes).
+        style_preferences: Optional hints for visual style or layout.
+        focus: Optional list of emphasis areas (e.g., ["security", "scalability"]).
+
+    Returns:
+        A single formatted prompt string ready to send to the LLM.
+    """
+    if not isinstance(user_prompt, str) or not user_prompt.strip():
+        raise ValueError("user_prompt must be a non-empty string")
+
+    # Interned so the several table lookups below compare keys by identity
+    diagram_key = sys.intern(diagram_type.lower().strip())
+    if diagram_key not in _DIAGRAM_GUIDANCE:
+        valid = ", ".join(sorted(_DIAGRAM_GUIDANCE))
+        raise ValueError(f"Unsupported diagram_type '{diagram_type}'. Valid options: {valid}")
+
+    fmt = sys.intern(output_format.lower().strip())
+    if fmt not in SUPPORTED_FORMATS:
+        valid_formats = ", ".join(sorted(SUPPORTED_FORMATS))
+        raise ValueError(f"Unsupported output_format '{output_format}'. Valid options: {valid_formats}")
+
+    if not (context or schema or style_preferences or focus):
+        user_goal = user_prompt.strip()
+        if "\n" not in user_goal:
+            prefix, suffix = _MINIMAL_PROMPTS[diagram_key, fmt]
+            return prefix + user_goal + suffix
+
+    context_section = _format_context(context)
+
+    schema_section = "None"
+    if schema:
+        try:
+            schema_section = json.dumps(schema, indent=2, ensure_ascii=False)
+        except TypeError:
+            schema_section = str(schema)
+
+    style_section = "None"
+    if style_preferences:
+        try:
+            style_section = json.dumps(style_preferences, indent=2, ensure_ascii=False)
+        except TypeError:
+            style_section = str(style_preferences)
+
+    focus_section = "None"
+    if focus:
+        cleaned = [item.strip() for item in focus if str(item).strip()]
+        if cleaned:
+            focus_section = "\n".join(f"- {item}" for item in cleaned)
+
+    return _render_prompt(
+        user_prompt.strip(),
+        diagram_key,
+        fmt,
+        context_section,
+        schema_section,
+        style_section,
+        focus_section,
+    )
+
+
 __all__ = ["build_plantuml_prompt", "SUPPORTED_FORMATS"]
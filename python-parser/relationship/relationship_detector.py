@@ -4,11 +4,41 @@ Centralized relationship inference and detection across all languages
 """
 
 import logging
+import re
+import sys
+from collections import deque
 from typing import Dict, List, Set
 from constants import RELATIONSHIP_TYPES
 
 logger = logging.getLogger(__name__)
 
+# Membership set for the relationship type values (RELATIONSHIP_TYPES maps names to values)
+_VALID_REL_TYPES = frozenset(RELATIONSHIP_TYPES.values())
+# Relationship types allowed to point from a class to itself
+_SELF_REL_ALLOWED = frozenset({'dependency'})
+
+# Type part of a "fieldName: Type" field: up to the next ':' or the start of generics/arrays
+_FIELD_TYPE_RE = re.compile(r':([^:<\[]*)')
+
+# Keys of a relationship holding class or type names
+_REL_NAME_KEYS = ('from', 'to', 'type')
+
+# Relationship types that form edges for circular-dependency detection
+_CYCLE_EDGE_TYPES = frozenset({'extends', 'implements', 'composition', 'dependency'})
+
+# Strength ranks (lower is stronger) and the rank of each relationship type; others are weak
+_STRENGTH_RANK = {'strong': 0, 'medium': 1, 'weak': 2}
+_TYPE_STRENGTH_RANK = {
+    'extends': 0,
+    'implements': 0,
+    'composition': 1,
+    'aggregation': 1,
+    'association': 1,
+    'uses': 2,
+    'dependency': 2,
+    'creates': 2
+}
+
 
 class RelationshipDetector:
     """
@@ -20,6 +50,49 @@ class RelationshipDetector:
         self.relationships: List[Dict] = []
         self.all_classes: Set[str] = set()
     
+    @property
+    def relationships(self) -> List[Dict]:
+        return self._relationships
+    
+    @relationships.setter
+    def relationships(self, relationships: List[Dict]):
+        self._relationships = relationships
+        self._dirty = True
+    
+    def _rebuild_indices(self):
+        """
+        Index the current relationships by source, target and type in one pass.
+        
+        The lookups below reuse these until the relationships are reassigned, added to,
+        or change length in place.
+        """
+        outgoing: Dict[str, List[Dict]] = {}
+        incoming: Dict[str, List[Dict]] = {}
+        by_type: Dict[str, List[Dict]] = {}
+        graph: Dict[str, List[str]] = {}
+        
+        for rel in self._relationships:
+            from_class = rel.get('from')
+            to_class = rel.get('to')
+            rel_type = rel.get('type')
+            outgoing.setdefault(from_class, []).append(rel)
+            incoming.setdefault(to_class, []).append(rel)
+            by_type.setdefault(rel_type, []).append(rel)
+            if rel_type in _CYCLE_EDGE_TYPES:
+                graph.setdefault(from_class, []).append(to_class)
+        
+        self._outgoing = outgoing
+        self._incoming = incoming
+        self._by_type = by_type
+        self._graph = graph
+        self._indexed_len = len(self._relationships)
+        self._dirty = False
+    
+    def _ensure_indices(self):
+        # The list is exposed directly, so also catch appends/removals made through it
+        if self._dirty or self._indexed_len != len(self._relationships):
+            self._rebuild_indices()
+    
     def set_classes(self, classes: List[Dict]):
         """
         Set the list of all known classes.
@@ -27,6 +100,13 @@ class RelationshipDetector:
         Args:
             classes: List of class dictionaries
         """
+        # Names come from worker processes un-interned; interning them once lets the many
+        # set/dict lookups below match by identity instead of comparing characters
+        intern = sys.intern
+        for cls in classes:
+            name = cls['class']
+            if type(name) is str:
+                cls['class'] = intern(name)
         self.all_classes = {cls['class'] for cls in classes}
         logger.info(f"Loaded {len(self.all_classes)} classes for relationship detection")
     
@@ -37,7 +117,14 @@ class RelationshipDetector:
         Args:
             relationships: List of relationship dictionaries
         """
-        self.relationships.extend(relationships)
+        intern = sys.intern
+        for rel in relationships:
+            for key in _REL_NAME_KEYS:
+                value = rel.get(key)
+                if type(value) is str:
+                    rel[key] = intern(value)
+        self._relationships.extend(relationships)
+        self._dirty = True
     
     def validate_relationships(self) -> List[Dict]:
         """
@@ -46,12 +133,15 @@ class RelationshipDetector:
         Returns:
             List of valid relationships
         """
+        is_valid = self._is_valid_relationship
+        # Skip formatting the per-relationship message unless debug logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
         valid_relationships = []
         
         for rel in self.relationships:
-            if self._is_valid_relationship(rel):
+            if is_valid(rel):
                 valid_relationships.append(rel)
-            else:
+            elif debug:
                 logger.debug(
                     f"Filtered invalid relationship: {rel.get('from')} -> {rel.get('to')} "
                     f"({rel.get('type')})"
@@ -77,11 +167,11 @@ class RelationshipDetector:
         rel_type = rel.get('type')
         
         # Must have all required fields
-        if not all([from_class, to_class, rel_type]):
+        if not (from_class and to_class and rel_type):
             return False
         
         # Type must be valid
-        if rel_type not in RELATIONSHIP_TYPES.values():
+        if rel_type not in _VALID_REL_TYPES:
             return False
         
         # Both classes must exist (except for dependencies which might be external)
@@ -90,7 +180,7 @@ class RelationshipDetector:
                 return False
         
         # No self-relationships (except certain types)
-        if from_class == to_class and rel_type not in ['dependency']:
+        if from_class == to_class and rel_type not in _SELF_REL_ALLOWED:
             return False
         
         return True
@@ -131,24 +221,28 @@ class RelationshipDetector:
         """
         inferred = []
         
-        # Build field type mapping
+        # Build field type mapping, and index classes by name (first occurrence wins)
         field_types = {}
+        class_index: Dict[str, Dict] = {}
         for cls in classes:
             class_name = cls['class']
-            field_types[class_name] = set()
+            field_types[class_name] = types = set()
+            class_index.setdefault(class_name, cls)
             
-            for field in cls.get('fields', []):
-                # Extract type from "fieldName: Type" format
-                if ':' in field:
-                    field_type = field.split(':')[1].strip()
-                    # Remove generics
-                    field_type = field_type.split('<')[0].split('[')[0].strip()
-                    field_types[class_name].add(field_type)
+            fields = cls.get('fields')
+            if not fields:
+                continue
+            for field in fields:
+                # Extract type from "fieldName: Type" format, without generics
+                match = _FIELD_TYPE_RE.search(field)
+                if match:
+                    types.add(match.group(1).strip())
         
         # Infer composition relationships from field types
+        known = self.all_classes
         for class_name, types in field_types.items():
             for field_type in types:
-                if field_type in self.all_classes and field_type != class_name:
+                if field_type in known and field_type != class_name:
                     inferred.append({
                         'from': class_name,
                         'to': field_type,
@@ -156,19 +250,20 @@ class RelationshipDetector:
                         'source': 'inferred'
                     })
         
-        # Infer interface/abstract implementations
+        # Infer interface/abstract implementations; only edges pointing at the class matter,
+        # so walk its incoming index entries rather than every relationship
+        self._ensure_indices()
+        incoming = self._incoming
         for cls in classes:
             class_name = cls['class']
             
             # If class has abstract=False but inherits from abstract class, it implements it
             if not cls.get('abstract', False):
-                for rel in self.relationships:
-                    if rel.get('to') == class_name and rel.get('type') == 'extends':
+                for rel in incoming.get(class_name, ()):
+                    if rel.get('type') == 'extends':
                         base_class = rel.get('from')
                         # Find base class
-                        base_cls_dict = next(
-                            (c for c in classes if c['class'] == base_class), None
-                        )
+                        base_cls_dict = class_index.get(base_class)
                         if base_cls_dict and base_cls_dict.get('abstract', False):
                             inferred.append({
                                 'from': base_class,
@@ -190,12 +285,17 @@ class RelationshipDetector:
         Returns:
             Dictionary mapping relationship type to list of relationships
         """
-        categorized = {rel_type: [] for rel_type in RELATIONSHIP_TYPES}
-        
-        for rel in relationships:
-            rel_type = rel.get('type')
-            if rel_type in categorized:
-                categorized[rel_type].append(rel)
+        if relationships is self._relationships:
+            self._ensure_indices()
+            by_type = self._by_type
+            categorized = {rel_type: list(by_type.get(rel_type, ())) for rel_type in RELATIONSHIP_TYPES}
+        else:
+            categorized = {rel_type: [] for rel_type in RELATIONSHIP_TYPES}
+            
+            for rel in relationships:
+                rel_type = rel.get('type')
+                if rel_type in categorized:
+                    categorized[rel_type].append(rel)
         
         # Log statistics
         for rel_type, rels in categorized.items():
@@ -217,28 +317,12 @@ class RelationshipDetector:
         Returns:
             Filtered list
         """
-        strength_order = ['strong', 'medium', 'weak']
-        min_idx = strength_order.index(min_strength)
-        
-        strength_map = {
-            'extends': 'strong',
-            'implements': 'strong',
-            'composition': 'medium',
-            'aggregation': 'medium',
-            'association': 'medium',
-            'uses': 'weak',
-            'dependency': 'weak',
-            'creates': 'weak'
-        }
+        min_rank = _STRENGTH_RANK.get(min_strength)
+        if min_rank is None:
+            raise ValueError(f"Unknown relationship strength: {min_strength!r}")
         
-        filtered = []
-        for rel in relationships:
-            rel_type = rel.get('type')
-            strength = strength_map.get(rel_type, 'weak')
-            strength_idx = strength_order.index(strength)
-            
-            if strength_idx <= min_idx:
-                filtered.append(rel)
+        type_rank = _TYPE_STRENGTH_RANK
+        filtered = [rel for rel in relationships if type_rank.get(rel.get('type'), 2) <= min_rank]
         
         logger.info(
             f"Filtered relationships by strength ({min_strength}): "
@@ -256,14 +340,9 @@ class RelationshipDetector:
         Returns:
             Dictionary with 'incoming' and 'outgoing' relationships
         """
-        incoming = []
-        outgoing = []
-        
-        for rel in self.relationships:
-            if rel.get('from') == class_name:
-                outgoing.append(rel)
-            if rel.get('to') == class_name:
-                incoming.append(rel)
+        self._ensure_indices()
+        incoming = list(self._incoming.get(class_name, ()))
+        outgoing = list(self._outgoing.get(class_name, ()))
         
         return {
             'incoming': incoming,
@@ -275,51 +354,102 @@ class RelationshipDetector:
         """
         Detect circular dependencies between classes.
         
+        Uses an iterative Tarjan strongly-connected-components pass, so deep
+        hierarchies cannot hit the recursion limit. Each group of mutually
+        dependent classes is reported once, as one closed chain through it.
+        
         Returns:
-            List of circular dependency chains
+            List of circular dependency chains (first class repeated at the end)
         """
-        # Build adjacency list
-        graph = {}
-        for rel in self.relationships:
-            if rel.get('type') in ['extends', 'implements', 'composition', 'dependency']:
-                from_class = rel.get('from')
-                to_class = rel.get('to')
-                
-                if from_class not in graph:
-                    graph[from_class] = []
-                graph[from_class].append(to_class)
-        
-        # Find cycles using DFS
-        cycles = []
-        visited = set()
-        rec_stack = set()
+        # Adjacency list of dependency-like edges
+        self._ensure_indices()
+        graph = self._graph
         
-        def dfs(node, path):
-            visited.add(node)
-            rec_stack.add(node)
-            path.append(node)
-            
-            for neighbor in graph.get(node, []):
-                if neighbor not in visited:
-                    dfs(neighbor, path.copy())
-                elif neighbor in rec_stack:
-                    # Found cycle
-                    cycle_start = path.index(neighbor)
-                    cycle = path[cycle_start:] + [neighbor]
-                    if cycle not in cycles:
-                        cycles.append(cycle)
+        cycles = []
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        
+        for root in graph:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(graph[root]))]
             
-            rec_stack.remove(node)
-        
-        for node in graph:
-            if node not in visited:
-                dfs(node, [])
+            while work:
+                node, neighbors = work[-1]
+                for neighbor in neighbors:
+                    if neighbor not in index:
+                        index[neighbor] = lowlink[neighbor] = len(index)
+                        stack.append(neighbor)
+                        on_stack.add(neighbor)
+                        work.append((neighbor, iter(graph.get(neighbor, ()))))
+                        break
+                    if neighbor in on_stack and index[neighbor] < lowlink[node]:
+                        lowlink[node] = index[neighbor]
+                else:
+                    # All neighbours done: propagate to the parent, then pop a finished component
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        if lowlink[node] < lowlink[parent]:
+                            lowlink[parent] = lowlink[node]
+                    if lowlink[node] == index[node]:
+                        component = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.add(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in graph.get(node, ()):
+                            cycles.append(self._cycle_through(node, component, graph))
         
         if cycles:
             logger.warning(f"Detected {len(cycles)} circular dependencies")
         
         return cycles
     
+    @staticmethod
+    def _cycle_through(start: str, component: Set[str], graph: Dict[str, List[str]]) -> List[str]:
+        """
+        Shortest closed chain from ``start`` back to itself within one component.
+        
+        A self-edge on ``start`` only counts when it is the whole component, so a
+        multi-class tangle is shown through at least one other class.
+        
+        Args:
+            start: Class the chain begins and ends with
+            component: Classes of the strongly connected component containing ``start``
+            graph: Adjacency list of dependency edges
+            
+        Returns:
+            Chain of class names, with ``start`` repeated at the end
+        """
+        parents: Dict[str, str] = {}
+        queue = deque([start])
+        skip_self_edge = len(component) > 1
+        while queue:
+            node = queue.popleft()
+            for neighbor in graph.get(node, ()):
+                if neighbor == start:
+                    if skip_self_edge and node == start:
+                        continue
+                    chain = [start]
+                    while node != start:
+                        chain.append(node)
+                        node = parents[node]
+                    chain.append(start)
+                    chain.reverse()
+                    return chain
+                if neighbor in component and neighbor not in parents:
+                    parents[neighbor] = node
+                    queue.append(neighbor)
+        return [start, start]
+    
     def get_relationship_statistics(self) -> Dict:
         """
         Get statistics about detected relationships.
@@ -2,9 +2,11 @@
 Security utilities for safe operations
 """
 import re
-import urllib.parse
 from typing import Dict, Tuple
 
+# Only https://github.com/<user>/<repo>[/] is accepted; the anchors pin scheme and host
+_GITHUB_URL_RE = re.compile(r'^https://github\.com/([a-zA-Z0-9_.-]+)/([a-zA-Z0-9_.-]+)/?$')
+
 def validate_github_url(url: str) -> Tuple[bool, str, Dict]:
     """
     Validates and sanitizes GitHub URL for safe cloning
@@ -18,8 +20,7 @@ def validate_github_url(url: str) -> Tuple[bool, str, Dict]:
     url = url.strip()
     
     # Basic URL format validation
-    github_pattern = r'^https://github\.com/([a-zA-Z0-9_.-]+)/([a-zA-Z0-9_.-]+)/?$'
-    match = re.match(github_pattern, url)
+    match = _GITHUB_URL_RE.match(url)
     
     if not match:
         return False, "Invalid GitHub URL format. Expected: https://github.com/username/repository", {}
@@ -37,14 +38,6 @@ def validate_github_url(url: str) -> Tuple[bool, str, Dict]:
     if repository.endswith('.git'):
         repository = repository[:-4]
     
-    # Parse URL to ensure it's well-formed
-    try:
-        parsed = urllib.parse.urlparse(url)
-        if parsed.scheme != 'https' or parsed.netloc != 'github.com':
-            return False, "Only HTTPS GitHub URLs are allowed", {}
-    except Exception:
-        return False, "Malformed URL", {}
-    
     return True, "", {
         'username': username,
         'repository': repository,
@@ -4,8 +4,10 @@ Provides consistent error responses and logging
 """
 
 import logging
+import os
 import traceback
 from enum import Enum
+from functools import lru_cache
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 from flask import jsonify
@@ -79,15 +81,17 @@ def create_error_response(error: Exception, request_id: Optional[str] = None) ->
         }
     }
     
+    production = _is_production()
+    
     # Add details if available and not in production
-    if app_error.details and not _is_production():
+    if app_error.details and not production:
         response["error"]["details"] = app_error.details
         
     if request_id:
         response["error"]["requestId"] = request_id
     
     # Don't expose internal details in production
-    if _is_production() and app_error.error_type == ErrorType.INTERNAL:
+    if production and app_error.error_type == ErrorType.INTERNAL:
         response["error"]["message"] = "Internal server error"
     
     return response, app_error.status_code
@@ -135,9 +139,9 @@ def handle_error(func):
     wrapper.__name__ = func.__name__
     return wrapper
 
+@lru_cache(maxsize=1)
 def _is_production() -> bool:
-    """Check if running in production environment"""
-    import os
+    """Check if running in production environment (read once; the environment is fixed at startup)"""
     return os.getenv('FLASK_ENV') == 'production' or os.getenv('ENVIRONMENT') == 'production'
 
 # Common error creators for frequent scenarios